@@ -0,0 +1,422 @@
+'''
+Benchmarks for the SASpy job pipeline and parsers.
+
+Runs without PyMOL or ATSAS: pymol.cmd is replaced by mockpymol and the
+ATSAS tools by the stand-ins in fakeatsas.py. It measures
+
+  import     -- fresh import of the commands (saspy) and of the GUI
+  latency    -- submit-to-finish time of single jobs in the job engine
+  throughput -- batch workloads (batchcrysol, trajcrysol) in items/s
+  parsers    -- parsing of large CRYSOL, SUPALM and SASREF outputs
+
+and splits the job times into stages: PDB write, subprocess, parse and
+move-out. Results are written as JSON, so that runs of different SASpy
+versions can be compared:
+
+    python benchmarks/bench_saspy.py -o before.json
+    python benchmarks/bench_saspy.py -o after.json --compare before.json
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import threading
+import subprocess
+import contextlib
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, 'mockpymol'))
+sys.path.insert(0, os.path.dirname(here))
+sys.path.insert(0, here)
+
+import fakeatsas
+import legacyparsers
+
+class StageTimer:
+    '''Accumulate wall-clock time spent in wrapped SASpy functions'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.originals = []
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    total, count = self.totals.get(stage, (0.0, 0))
+                    self.totals[stage] = (total + time.time() - start,
+                                          count + 1)
+        return timed
+
+    def patch(self, owner, name, stage):
+        '''Replace owner.name by its timed version'''
+        func = getattr(owner, name)
+        self.originals.append((owner, name, func))
+        setattr(owner, name, self.wrap(stage, func))
+
+    @contextlib.contextmanager
+    def disabled(self):
+        '''Run with the original, untimed functions'''
+        timed = [(owner, name, getattr(owner, name))
+                 for owner, name, func in self.originals]
+        for owner, name, func in self.originals:
+            setattr(owner, name, func)
+        try:
+            yield
+        finally:
+            for owner, name, func in timed:
+                setattr(owner, name, func)
+
+    def reset(self):
+        with self.lock:
+            self.totals = {}
+
+    def report(self):
+        with self.lock:
+            return dict((stage, {'seconds': total, 'calls': count})
+                        for stage, (total, count) in self.totals.items())
+
+def instrument(saspy, timer):
+    '''Wrap the stages of the SASpy pipeline in timer'''
+    timer.patch(saspy, 'writePdb', 'pdb_write')
+    timer.patch(saspy, 'systemCommand', 'subprocess')
+    #the parsers every procedure ends up in, the older entry points
+    #(readNSDFromSupalmPdb, parseEulerAngles, ...) call these
+    for name in ('parseCrysolLog', 'parseSasrefChi2', 'readSupalmPdb',
+                 'readSasrefPdb'):
+        timer.patch(saspy, name, 'parse')
+    timer.patch(saspy.TemporaryDirectory, 'move_out', 'move_out')
+    timer.patch(saspy.TemporaryDirectory, 'move_out_numbered', 'move_out')
+
+@contextlib.contextmanager
+def quiet(enabled):
+    '''Silence SASpy messages and the output of the child processes'''
+    if not enabled:
+        yield
+        return
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(devnull)
+        os.close(saved)
+
+def summary(times):
+    times = sorted(times)
+    n = len(times)
+    median = times[n // 2] if n % 2 else 0.5 * (times[n // 2 - 1] + times[n // 2])
+    return {'runs': n, 'min': times[0], 'median': median,
+            'mean': sum(times) / n, 'max': times[-1]}
+
+def runJob(saspy, name, func, args):
+    start = time.time()
+    job = saspy.jobEngine.submit(name, func, args)
+    job.wait()
+    if 'done' != job.state:
+        raise RuntimeError('job %s %s: %s' % (name, job.state, job.error))
+    return time.time() - start
+
+def benchLatency(saspy, cmd, timer, opts):
+    cmd.addObject('lat1', opts.atoms)
+    cmd.addObject('lat2', opts.atoms)
+    procedures = [
+        ('predcrysol', saspy.predcrysol, ('no', ['lat1'])),
+        ('fitcrysol', saspy.fitcrysol, ('no', 'data.dat', ['lat1'])),
+        ('alpraxin', saspy.alpraxin, (['lat1'], 'no')),
+        ('supalm', saspy.supalm, ('lat1', 'lat2')),
+        ('sasref', saspy.sasref, ('data.dat', ['lat1', 'lat2'], 'local',
+                                    'primus')),
+        ('sreflex', saspy.sreflex, ('data.dat', ['lat1'], 'primus')),
+    ]
+    results = {}
+    for name, func, args in procedures:
+        timer.reset()
+        times = [runJob(saspy, name, func, args) for i in range(opts.repeat)]
+        results[name] = summary(times)
+        results[name]['stages'] = timer.report()
+    return results
+
+def benchThroughput(saspy, cmd, timer, opts):
+    results = {}
+    models = []
+    for i in range(opts.models):
+        name = 'pose%d' % i
+        cmd.addObject(name, opts.atoms + i)
+        models.append(name)
+    timer.reset()
+    start = time.time()
+    saspy.batchcrysol('no', 'data.dat', models, 'bench', '', opts.workers)
+    seconds = time.time() - start
+    results['batchcrysol'] = {'items': len(models), 'seconds': seconds,
+                              'per_second': len(models) / seconds,
+                              'stages': timer.report()}
+
+    cmd.addObject('traj', opts.atoms, opts.frames)
+    timer.reset()
+    start = time.time()
+    saspy.trajcrysol('traj', 'data.dat', 'no', 'bench', '', opts.workers)
+    seconds = time.time() - start
+    results['trajcrysol'] = {'items': opts.frames, 'seconds': seconds,
+                             'per_second': opts.frames / seconds,
+                             'stages': timer.report()}
+    return results
+
+def generateOutputs(folder, opts):
+    '''Write large CRYSOL, SUPALM and SASREF outputs with the fake tools'''
+    env = dict(os.environ)
+    env['FAKE_ATSAS_PADDING'] = repr(opts.log_lines)
+    env['FAKE_ATSAS_ATOMS'] = repr(opts.large_atoms // 4)
+    env['FAKE_ATSAS_DELAY'] = '0'
+    with open(os.path.join(folder, 'large.pdb'), 'w') as wf:
+        for i in range(opts.large_atoms):
+            wf.write(fakeatsas.atomLine(i + 1, i * 0.01, 0.0, 0.0))
+        wf.write('END\n')
+    data = os.path.join(folder, 'data.dat')
+    with open(data, 'w') as wf:
+        wf.write('0.01 1.0 0.1\n')
+    run = lambda args, **kw: subprocess.check_call(args, cwd=folder, env=env,
+                                                   stdout=subprocess.PIPE, **kw)
+    run(['crysol', 'large.pdb', data])
+    run(['supalm', '-o', 'supalm.pdb', 'large.pdb', 'large.pdb'])
+    com = ''.join(['%s ! line\n' % v for v in
+                   ('Expert', 'complex', 'complex', '', '4')])
+    with open(os.path.join(folder, 'setup.com'), 'w') as wf:
+        wf.write(com)
+    with open(os.path.join(folder, 'setup.com'), 'r') as rf:
+        run(['sasref'], stdin=rf)
+    return {'crysol_log': os.path.join(folder, 'large00.log'),
+            'supalm_pdb': os.path.join(folder, 'supalm.pdb'),
+            'sasref_pdb': os.path.join(folder, 'complex.pdb'),
+            'sasref_fit': os.path.join(folder, 'complex-1.fit')}
+
+def timeCall(func, arg, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        func(arg)
+        times.append(time.time() - start)
+    return summary(times)
+
+def parserCases(saspy, files):
+    '''(name, function, legacy function, file) of the parsers to benchmark'''
+    return [
+        ('parseCrysolLog', saspy.parseCrysolLog, legacyparsers.parseCrysolLog,
+         files['crysol_log']),
+        ('readNSDFromSupalmPdb', saspy.readNSDFromSupalmPdb,
+         legacyparsers.readNSDFromSupalmPdb, files['supalm_pdb']),
+        ('readTransformationMatrixFromPdbRemark',
+         saspy.readTransformationMatrixFromPdbRemark,
+         legacyparsers.readTransformationMatrixFromPdbRemark,
+         files['supalm_pdb']),
+        ('parseEulerAngles', saspy.parseEulerAngles,
+         legacyparsers.parseEulerAngles, files['sasref_pdb']),
+        ('parseSasrefChi2', saspy.parseSasrefChi2, None, files['sasref_fit']),
+    ]
+
+def sameResult(a, b):
+    '''Compare parser results as nested lists of floats'''
+    if isinstance(a, dict):
+        return sorted(a) == sorted(b) and \
+            all(sameResult(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(sameResult(x, y) for x, y in zip(a, b))
+    return abs(float(a) - float(b)) < 1e-6
+
+def benchParsers(saspy, folder, opts):
+    '''Time the parsers, and the SASpy 3.1.0 parsers as a baseline'''
+    files = generateOutputs(folder, opts)
+    results = {}
+    for name, func, legacy, fn in parserCases(saspy, files):
+        results[name] = timeCall(func, fn, opts.repeat)
+        results[name]['bytes'] = os.path.getsize(fn)
+        if legacy is None:
+            continue
+        baseline = timeCall(legacy, fn, opts.repeat)
+        results[name]['legacy_median'] = baseline['median']
+        results[name]['speedup'] = baseline['median'] / results[name]['median']
+        results[name]['same_result'] = sameResult(legacy(fn), func(fn))
+    return results
+
+importProbe = '''
+import sys, time, json
+start = time.time()
+import saspy
+core = time.time() - start
+tk = bool(set(['tkinter', 'Tkinter', 'Pmw']) & set(sys.modules))
+gui = None
+try:
+    start = time.time()
+    import saspy.gui
+    gui = time.time() - start
+except ImportError:
+    pass
+json.dump({'core': core, 'gui': gui, 'tk': tk}, sys.stdout)
+'''
+
+def benchImport(opts):
+    '''Time fresh imports of the core commands and of the GUI'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.join(here, 'mockpymol'),
+                                         os.path.dirname(here)])
+    runs = []
+    for i in range(opts.repeat):
+        out = subprocess.check_output([sys.executable, '-c', importProbe],
+                                      env=env)
+        runs.append(json.loads(out.decode('utf-8').splitlines()[-1]))
+    results = {'core': summary([r['core'] for r in runs]),
+               'core_loads_tk': runs[0]['tk']}
+    if runs[0]['gui'] is not None:
+        results['gui'] = summary([r['gui'] for r in runs])
+    return results
+
+def flatten(tree, prefix = ''):
+    out = {}
+    for key, value in tree.items():
+        name = prefix + '.' + key if prefix else key
+        if isinstance(value, dict):
+            out.update(flatten(value, name))
+        elif isinstance(value, float):
+            out[name] = value
+    return out
+
+def compare(old, new):
+    '''Print the relative change of every timing present in both runs'''
+    a = flatten(old['results'])
+    b = flatten(new['results'])
+    sys.stdout.write('%-70s %12s %12s %8s\n' % ('metric', old['saspy_version'],
+                                               new['saspy_version'], 'ratio'))
+    for key in sorted(set(a) & set(b)):
+        if not key.endswith(('median', 'seconds', 'per_second')):
+            continue
+        ratio = b[key] / a[key] if a[key] else float('nan')
+        sys.stdout.write('%-70s %12.5f %12.5f %8.3f\n' % (key, a[key], b[key],
+                                                         ratio))
+
+def gitRevision():
+    try:
+        out = subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                      cwd=here, stderr=subprocess.STDOUT)
+        return out.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', default='bench_saspy.json',
+                        help='JSON file for the results')
+    parser.add_argument('--compare', help='earlier JSON results to compare to')
+    parser.add_argument('--only', default='import,latency,throughput,parsers',
+                        help='comma separated workloads to run')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='repetitions of each latency and parser case')
+    parser.add_argument('--models', type=int, default=50,
+                        help='models in the batch workload')
+    parser.add_argument('--frames', type=int, default=100,
+                        help='states in the trajectory workload')
+    parser.add_argument('--atoms', type=int, default=500,
+                        help='atoms per model')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='concurrent processes, 0 for one per core')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='seconds each fake ATSAS tool sleeps')
+    parser.add_argument('--large-atoms', type=int, default=100000,
+                        help='atoms in the PDB outputs for the parsers')
+    parser.add_argument('--log-lines', type=int, default=50000,
+                        help='lines in the CRYSOL log for the parsers')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the CRYSOL result cache enabled')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show SASpy and tool output')
+    opts = parser.parse_args()
+    output = os.path.abspath(opts.output)
+
+    root = tempfile.mkdtemp(prefix='saspy_bench')
+    origdir = os.getcwd()
+    try:
+        bindir = fakeatsas.install(os.path.join(root, 'bin'))
+        os.environ['PATH'] = bindir + os.pathsep + os.environ['PATH']
+        os.environ['FAKE_ATSAS_DELAY'] = repr(opts.delay)
+        workdir = os.path.join(root, 'work')
+        os.makedirs(workdir)
+        os.chdir(workdir)
+        with open('data.dat', 'w') as wf:
+            wf.write('0.01 1.0 0.1\n')
+
+        with quiet(not opts.verbose):
+            start = time.time()
+            import saspy
+            importTime = time.time() - start
+        saspy = sys.modules['saspy.core']
+        from pymol import cmd
+        #keep the caches, results store and workspaces of the user clean
+        saspy.crysolCache.folder = os.path.join(root, 'cache')
+        saspy.resultsStore.path = os.path.join(root, 'results.sqlite')
+        saspy.workspacePool.folder = os.path.join(root, 'workspaces')
+        os.makedirs(saspy.workspacePool.folder)
+        saspy.workspacePool.failedRoot = os.path.join(root, 'failed')
+        saspy.pdbStage.folder = os.path.join(root, 'stage')
+        os.makedirs(saspy.pdbStage.folder)
+        if not opts.cache:
+            saspy.crysolCache.maxSize = 0
+        timer = StageTimer()
+        instrument(saspy, timer)
+
+        results = {'import': {'seconds': importTime}}
+        workloads = opts.only.split(',')
+        with quiet(not opts.verbose):
+            if 'import' in workloads:
+                results['import'].update(benchImport(opts))
+            if 'latency' in workloads:
+                results['latency'] = benchLatency(saspy, cmd, timer, opts)
+            if 'throughput' in workloads:
+                results['throughput'] = benchThroughput(saspy, cmd, timer, opts)
+            if 'parsers' in workloads:
+                parsedir = os.path.join(root, 'parsers')
+                os.makedirs(parsedir)
+                with timer.disabled():
+                    results['parsers'] = benchParsers(saspy, parsedir, opts)
+    finally:
+        os.chdir(origdir)
+        core = sys.modules.get('saspy.core')
+        if core is not None:
+            #nothing may be written below root at exit
+            core.resultsStore.flush()
+            core.resultsStore.path = ''
+            core.workspacePool.clear()
+            core.pdbStage.clear()
+        shutil.rmtree(root, ignore_errors=True)
+
+    report = {'saspy_version': saspy.saspyVersion,
+              'git': gitRevision(),
+              'python': sys.version.split()[0],
+              'platform': platform.platform(),
+              'cpus': saspy.defaultWorkers(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'config': vars(opts),
+              'results': results}
+    with open(output, 'w') as wf:
+        json.dump(report, wf, indent=2, sort_keys=True)
+    sys.stdout.write('Results written to %s\n' % output)
+    for key, value in sorted(flatten(results).items()):
+        if key.endswith(('median', 'seconds', 'per_second', 'speedup')) and \
+                '.stages.' not in key:
+            sys.stdout.write('%-60s %12.5f\n' % (key, value))
+    if opts.compare:
+        with open(opts.compare, 'r') as rf:
+            compare(json.load(rf), report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+'''
+Stand-ins for the ATSAS executables used by SASpy.
+
+Each tool parses the command line the way SASpy calls it and writes
+output files in the format the SASpy parsers expect, so that the job
+pipeline can be exercised without an ATSAS installation. The behaviour
+is tuned with environment variables:
+
+FAKE_ATSAS_DELAY   -- seconds each tool sleeps to mimic computation (0)
+FAKE_ATSAS_PADDING -- extra lines written to CRYSOL logs (200)
+FAKE_ATSAS_ATOMS   -- atoms per subunit in SASREF output PDBs (100)
+FAKE_SASREF_STEPS  -- annealing steps printed by SASREF (10)
+
+USAGE: python fakeatsas.py --install DIR
+creates executables crysol, sasref, ... in DIR, which is then put
+in front of PATH.
+'''
+import os
+import sys
+import time
+import random
+
+tools = ('crysol', 'adderrors', 'alpraxin', 'supalm', 'sasref', 'sreflex',
+         'primus')
+
+def env(name, default):
+    return type(default)(os.environ.get(name, default))
+
+def delay():
+    time.sleep(env('FAKE_ATSAS_DELAY', 0.0))
+
+def atomLine(i, x, y, z):
+    return ("ATOM  %5d  CA  ALA A%4d    %8.3f%8.3f%8.3f  1.00  0.00"
+            "           C\n" % (i % 100000, i % 10000, x, y, z))
+
+def readAtoms(pdbfn):
+    coords = []
+    with open(pdbfn, 'r') as rf:
+        for line in rf:
+            if line.startswith('ATOM') or line.startswith('HETATM'):
+                coords.append((float(line[30:38]), float(line[38:46]),
+                               float(line[46:54])))
+    return coords
+
+def radiusOfGyration(coords):
+    if 0 == len(coords):
+        return 0.0
+    n = float(len(coords))
+    c = [sum(p[k] for p in coords) / n for k in range(3)]
+    return (sum(sum((p[k] - c[k]) ** 2 for k in range(3))
+                for p in coords) / n) ** 0.5
+
+def transformationRemark(rows):
+    #4x4 matrix as written by SUPALM and ALPRAXIN
+    out = ''
+    for i, row in enumerate(rows):
+        head = 'REMARK 265 Transformation matrix   :' if 0 == i else 'REMARK 265'
+        out += head.ljust(39) + ''.join('%12.6f' % v for v in row) + '\n'
+    return out
+
+def crysol(args):
+    '''crysol [-eh] [-p name] [-ns n] file.pdb [data.dat]'''
+    delay()
+    almid = None
+    files = []
+    i = 0
+    while i < len(args):
+        if '-p' == args[i]:
+            almid = args[i + 1]
+            i += 2
+        elif args[i] in ('-ns', '-sm', '-lm', '-fb'):
+            i += 2
+        elif args[i].startswith('-'):
+            i += 1
+        else:
+            files.append(args[i])
+            i += 1
+    coords = readAtoms(files[0])
+    rg = radiusOfGyration(coords)
+    if almid is not None:
+        with open(almid + '.alm', 'w') as wf:
+            wf.write(' Amplitudes of %d atoms, Rg %.3f\n' % (len(coords), rg))
+            for l in range(50):
+                wf.write('%4d %14.6E %14.6E\n' % (l, 1.0 / (l + 1), 0.0))
+        return 0
+    fid = os.path.splitext(os.path.basename(files[0]))[0]
+    chi2 = 0.8 + (len(coords) % 17) * 0.05
+    log = []
+    log.append(' ***  ----------------------------------------------  ***')
+    log.append(' ***    CRYSOL  (fake)  evaluation of SAXS patterns     ***')
+    log.append(' ***  ----------------------------------------------  ***')
+    log.append(' Number of atoms read ............................ : %d'
+               % len(coords))
+    for k in range(env('FAKE_ATSAS_PADDING', 200)):
+        log.append(' Harmonics %4d ....................................... : done'
+                   % k)
+    if 1 < len(files):
+        log.append(' Fitting parameters')
+        log.append('  Dro      Ra      RGT       Vol          Chi^2')
+        log.append('%-66s%7.3f' % ('    0.030   1.400   %6.2f  0.2757E+05'
+                                   % rg, chi2))
+    log.append('%-59s%6.2f' % (' Rg from the slope of net intensity ........ :',
+                               rg))
+    log.append('%-59s%7.3f' % (' Average electron density ......... :', 0.436))
+    with open(fid + '00.log', 'w') as wf:
+        wf.write('\n'.join(log) + '\n')
+    with open(fid + '00.int', 'w') as wf:
+        for k in range(1, 257):
+            wf.write('%14.6E %14.6E\n' % (k * 0.002, 1e3 / k))
+    if 1 < len(files):
+        with open(fid + '00.fit', 'w') as wf:
+            wf.write(' Chi^2: %.3f\n' % chi2)
+            for k in range(1, 257):
+                wf.write('%14.6E %14.6E %14.6E\n' % (k * 0.002, 1e3 / k,
+                                                     1e3 / k))
+    sys.stdout.write(' CRYSOL finished for %s\n' % fid)
+    return 0
+
+def adderrors(args):
+    '''adderrors file.int -o file.dat'''
+    out = args[args.index('-o') + 1]
+    with open(args[0], 'r') as rf, open(out, 'w') as wf:
+        for line in rf:
+            wf.write(line.rstrip('\n') + ' %14.6E\n' % 1.0)
+    return 0
+
+def alpraxin(args):
+    '''alpraxin in.pdb [--enantiomorph=Y] -o out.pdb'''
+    delay()
+    out = args[args.index('-o') + 1]
+    with open(args[0], 'r') as rf:
+        body = rf.read()
+    with open(out, 'w') as wf:
+        wf.write(transformationRemark(((1, 0, 0, -1.0), (0, 1, 0, -2.0),
+                                       (0, 0, 1, -3.0), (0, 0, 0, 1))))
+        wf.write(body)
+    return 0
+
+def supalm(args):
+    '''supalm -o out.pdb --prog2=crysol --enantiomorphs=N ref.pdb mov.pdb'''
+    delay()
+    out = args[args.index('-o') + 1]
+    files = [a for a in args if not a.startswith('-') and a != out]
+    with open(files[-1], 'r') as rf:
+        body = rf.read()
+    nsd = 0.9 + (len(body) % 97) / 100.0
+    with open(out, 'w') as wf:
+        wf.write('%-38s%11.4f\n' % ('REMARK 265 Final distance      :', nsd))
+        wf.write(transformationRemark(((0, -1, 0, 1.5), (1, 0, 0, 2.5),
+                                       (0, 0, 1, 3.5), (0, 0, 0, 1))))
+        wf.write(body)
+    return 0
+
+def sasref(args):
+    '''sasref < setup_sasref.com'''
+    lines = sys.stdin.read().splitlines()
+    value = lambda i: lines[i].split('!')[0].strip()
+    prefix = value(1)
+    seed = value(3)
+    nsub = int(value(4))
+    rnd = random.Random(seed or 0)
+    steps = env('FAKE_SASREF_STEPS', 10)
+    pause = env('FAKE_ATSAS_DELAY', 0.0) / steps
+    t = 10.0
+    chi2 = 10.0
+    for s in range(1, steps + 1):
+        time.sleep(pause)
+        chi2 *= 0.7 + 0.25 * rnd.random()
+        sys.stdout.write(' T= %10.3E   Iter= %5d   Suc= %5d   Fit: %10.4f\n'
+                         % (t, s, 50, chi2))
+        sys.stdout.flush()
+        t *= 0.9
+    natoms = env('FAKE_ATSAS_ATOMS', 100)
+    with open(prefix + '.pdb', 'w') as wf:
+        wf.write('REMARK 265 SASREF (fake) solution, Chi^2 %.4f\n' % chi2)
+        for k in range(nsub):
+            wf.write('REMARK Old center positioned at %7.2f %7.2f %7.2f\n'
+                     % (1.0 + k, 2.0, 3.0))
+            wf.write('REMARK Rotated by Euler angles: %7.2f %7.2f %7.2f\n'
+                     % (rnd.uniform(0, 360), rnd.uniform(0, 180),
+                        rnd.uniform(0, 360)))
+            wf.write('REMARK New center positioned at %7.2f %7.2f %7.2f\n'
+                     % (rnd.uniform(-20, 20), rnd.uniform(-20, 20),
+                        rnd.uniform(-20, 20)))
+            for i in range(natoms):
+                wf.write(atomLine(i + 1, i * 0.1, k * 2.0, 0.0))
+            wf.write('TER\n')
+        wf.write('END\n')
+    with open(prefix + '-1.fit', 'w') as wf:
+        wf.write(' Chi^2 = %10.4f\n' % chi2)
+        for k in range(1, 257):
+            wf.write('%14.6E %14.6E %14.6E\n' % (k * 0.002, 1e3 / k, 1e3 / k))
+    with open(prefix + '.log', 'w') as wf:
+        wf.write(' Final Chi^2 = %10.4f\n' % chi2)
+    return 0
+
+def sreflex(args):
+    '''sreflex -p outdir data.dat a.pdb,b.pdb'''
+    delay()
+    df = args[args.index('-p') + 1]
+    for sub in ('models', 'fits'):
+        if not os.path.isdir(os.path.join(df, sub)):
+            os.makedirs(os.path.join(df, sub))
+    with open(os.path.join(df, 'report.txt'), 'w') as report:
+        for modelid, chi2 in (('rc01_1', 1.12), ('uc01_1', 1.31),
+                              ('rc02_1', 2.05)):
+            with open(os.path.join(df, 'models', modelid + '.pdb'), 'w') as wf:
+                wf.write(atomLine(1, 0.0, 0.0, 0.0) + 'END\n')
+            with open(os.path.join(df, 'fits', modelid + '.fit'), 'w') as wf:
+                wf.write('%14.6E %14.6E %14.6E\n' % (0.01, 1.0, 1.0))
+            report.write('%-10s %8.3f\n' % (modelid, chi2))
+    return 0
+
+def primus(args):
+    return 0
+
+def install(folder):
+    '''Create one executable per tool in folder, return the folder'''
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    here = os.path.dirname(os.path.abspath(__file__))
+    for tool in tools:
+        fn = os.path.join(folder, tool)
+        with open(fn, 'w') as wf:
+            wf.write('#!%s\n' % sys.executable)
+            wf.write('import sys\n')
+            wf.write('sys.path.insert(0, %r)\n' % here)
+            wf.write('import fakeatsas\n')
+            wf.write('sys.exit(fakeatsas.%s(sys.argv[1:]))\n' % tool)
+        os.chmod(fn, 0o755)
+    return folder
+
+if __name__ == '__main__':
+    if 3 == len(sys.argv) and '--install' == sys.argv[1]:
+        install(sys.argv[2])
+    else:
+        sys.stdout.write(__doc__)
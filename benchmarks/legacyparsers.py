@@ -0,0 +1,99 @@
+'''
+Output parsers of SASpy 3.1.0, before the single-pass parser section.
+
+Kept verbatim as the baseline of the parser benchmark. Note that
+readTransformationMatrixFromPdbRemark loops forever on files without
+a transformation matrix.
+'''
+import re
+
+def parseCrysolLog (logFileName):
+    '''Parse Crysol log file, obtain Chi2, Rg and eDens'''
+    #will not parse crysol_summary.txt, but the .log file 
+    #created for each individual run
+
+    chi2 = 9999;
+    Rg = 9999;
+    eDens = 9999;
+
+    position = -1
+    counter = 0
+    with open(logFileName, 'r') as rf:
+        for line in rf:
+            counter += 1
+            if re.match("(.*)Fitting parameters(.*)", line):
+                print("line number: " + repr(counter))
+                position = counter + 2
+            if counter == position:
+                if line[66:73] != "*******":
+                    chi2 = float(line[66:73])
+            if re.match("(.*)Rg from the slope of net intensity(.*)", line):
+                Rg = float(line[59:65])
+            if re.match("(.*)Average electron density(.*)", line):
+                eDens = float(line[59:66])
+    rf.close()
+    return {'chi2':chi2, 'Rg':Rg, 'eDens':eDens}
+
+def readNSDFromSupalmPdb(pdbfn):
+    """parse NSD value from SUPALM output PDB file
+    useful for Windows users without console access"""
+    nsd = 9999;
+    with open(pdbfn, 'r') as rf:
+        for line in rf:
+            if re.match("(.*)Final distance(.*)", line):
+                nsd = float(line[38:49])
+                break
+    return nsd
+
+def readTransformationMatrixFromPdbRemark(pdbfn):
+    #read transformation matrix from output pdb
+    #useful for alpraxin and supalm
+    rf = open(pdbfn, 'r')
+    read = 1
+    a=[]
+    c=4
+
+    while(1):
+        line=rf.readline()
+        if re.match("(.*)Transformation(.*)", line):
+            while(c):
+                a.append(line[39:51])
+                a.append(line[51:63])
+                a.append(line[63:75])
+                a.append(line[75:87])
+                line=rf.readline()
+                c=c-1;
+            break 
+    rf.close()
+    pymolOrder=[1, 5, 9, 13, 2, 6, 10, 14, 3, 7, 11, 15, 4, 8, 12, 16]
+    p=[]; #output in pymol's format
+    for i in pymolOrder:
+        p.append(float (a[i-1]))
+    return p
+
+def parseEulerAngles(filename):
+    '''Parse Euler angles and translations 
+    per subunit from SASREF output PDB'''
+
+    #temporal storage of values, one set per subunit
+    collection = []
+    move = []
+
+    with open(filename, 'r') as rf:
+        for line in rf:
+            if re.match("REMARK Old center positioned at(.*)", line):
+                move.append(float(line[32:39]))
+                move.append(float(line[40:47]))
+                move.append(float(line[48:55]))
+            if re.match("REMARK Rotated by Euler angles(.*)", line):
+                move.append(float(line[32:39]))
+                move.append(float(line[40:47]))
+                move.append(float(line[48:55]))
+            if re.match("REMARK New center positioned at(.*)", line):
+                move.append(float(line[32:39]))
+                move.append(float(line[40:47]))
+                move.append(float(line[48:55]))
+            if re.match("TER", line):
+                collection.append(move)
+                move = []
+    return collection
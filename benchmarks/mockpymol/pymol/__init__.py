@@ -0,0 +1 @@
+'''Stand-in for the pymol package, see cmd.py'''
@@ -0,0 +1 @@
+'''Stand-in for pymol.cgo, SASpy does not draw CGO objects'''
@@ -0,0 +1,147 @@
+'''
+Minimal stand-in for pymol.cmd, enough to run SASpy without PyMOL.
+
+Objects are lists of states, each a list of [x, y, z] coordinates.
+Commands that only change the display are accepted and ignored.
+'''
+import os
+import threading
+
+objects = {}
+commands = {}
+calls = []
+lock = threading.Lock()
+
+def addObject(name, natoms = 100, states = 1):
+    '''Create an object with natoms atoms in every state'''
+    with lock:
+        objects[name] = [[[i * 1.5 + s * 0.01, (i % 7) * 1.1, (i % 5) * 0.9]
+                          for i in range(natoms)] for s in range(states)]
+
+def names(selection):
+    out = []
+    for word in selection.replace('(', ' ').replace(')', ' ').split():
+        if word not in ('or', 'and') and word in objects:
+            out.append(word)
+    return out
+
+def stateCoords(name, state):
+    states = objects[name]
+    if 0 < state:
+        return states[state - 1]
+    return states[0]
+
+def extend(name, function):
+    commands[name] = function
+
+def get_object_list(selection = '(all)'):
+    return list(objects)
+
+def count_states(selection = '(all)'):
+    return max([len(objects[n]) for n in names(selection)] or [0])
+
+def count_atoms(selection = '(all)', state = 0):
+    return len(get_coords(selection, state))
+
+def save(filename, selection = '(all)', state = -1, *args, **kwargs):
+    with open(filename, 'w') as wf:
+        count = 0
+        for name in names(selection):
+            for x, y, z in stateCoords(name, state):
+                count += 1
+                wf.write("ATOM  %5d  CA  ALA A%4d    %8.3f%8.3f%8.3f"
+                         "  1.00  0.00           C\n"
+                         % (count % 100000, count % 10000, x, y, z))
+            wf.write("TER\n")
+        wf.write("END\n")
+
+def get_coords(selection = '(all)', state = 1):
+    coords = []
+    for name in names(selection):
+        coords.extend(stateCoords(name, state))
+    return [list(c) for c in coords]
+
+def load_coords(coords, selection, state = 1):
+    i = 0
+    with lock:
+        for name in names(selection):
+            atoms = stateCoords(name, state)
+            for j in range(len(atoms)):
+                atoms[j] = [float(v) for v in coords[i]]
+                i += 1
+    calls.append(('load_coords', selection))
+
+def transform_selection(selection, matrix, *args, **kwargs):
+    #PyMOL TTT: rotate (x + pre-translation), then add the post-translation
+    m = [float(v) for v in matrix]
+    with lock:
+        for name in names(selection):
+            for state in objects[name]:
+                for atom in state:
+                    x = atom[0] + m[12]
+                    y = atom[1] + m[13]
+                    z = atom[2] + m[14]
+                    atom[0] = m[0] * x + m[1] * y + m[2] * z + m[3]
+                    atom[1] = m[4] * x + m[5] * y + m[6] * z + m[7]
+                    atom[2] = m[8] * x + m[9] * y + m[10] * z + m[11]
+    calls.append(('transform_selection', selection))
+
+def load(filename, name = '', *args, **kwargs):
+    if '' == name:
+        name = os.path.splitext(os.path.basename(filename))[0]
+    natoms = 0
+    with open(filename, 'r') as rf:
+        for line in rf:
+            if line.startswith('ATOM') or line.startswith('HETATM'):
+                natoms += 1
+    addObject(name, natoms)
+    calls.append(('load', filename, name))
+
+def align(mobile, target, *args, **kwargs):
+    calls.append(('align', mobile, target))
+    return [0.5, 100, 5, 0.6, 110, 0.0, 100]
+
+def iterate(selection, expression, space = None, *args, **kwargs):
+    #every atom is a CA of an alanine, as written by save()
+    space = {} if space is None else space
+    count = 0
+    for name in names(selection):
+        for atom in stateCoords(name, 1):
+            count += 1
+            atomSpace = dict(space, type='ATOM', ID=count, name='CA', alt='',
+                             resn='ALA', chain='A', resi=str(count % 10000),
+                             q=1.0, b=0.0, segi='', elem='C',
+                             formal_charge=0, model=name)
+            exec(expression, atomSpace)
+
+def create(name, selection, *args, **kwargs):
+    with lock:
+        sources = [objects[n] for n in names(selection)]
+        nstates = max([len(states) for states in sources] or [0])
+        objects[name] = [[list(atom) for states in sources
+                          for atom in states[min(s, len(states) - 1)]]
+                         for s in range(nstates)]
+    calls.append(('create', name, selection))
+
+def set_name(old, new):
+    with lock:
+        objects[new] = objects.pop(old)
+
+def delete(name):
+    with lock:
+        objects.pop(name, None)
+
+def cd(folder):
+    os.chdir(folder)
+
+def hide(*args, **kwargs):
+    pass
+
+def show(*args, **kwargs):
+    pass
+
+def color(*args, **kwargs):
+    pass
+
+def set(*args, **kwargs):
+    pass
@@ -0,0 +1,26 @@
+# python lib
+'''
+SASpy - ATSAS PLUGIN FOR PYMOL
+
+Importing the package registers the SASpy commands of saspy.core and
+saspy.executors and the batch runner of saspy.batch (python -m saspy
+manifest.json). The Tk/Pmw dialog in saspy.gui is only imported when it
+is opened, so headless PyMOL (pymol -cq) does not need Tk or Pmw.
+
+(c) 2015-2019 A.PANJKOVICH AND H.MERTENS FOR ATSAS TEAM AT EMBL-HAMBURG.
+'''
+from .core import *
+from . import batch
+from . import executors
+
+def __init__(self):
+    """ SASpy - ATSAS Plugin for PyMOL
+    """
+    self.menuBar.addmenuitem('Plugin', 'command',
+                             'SASpy', label = 'SASpy',
+                             command = lambda s=self : openDialog(s))
+
+def openDialog(app):
+    '''Import the GUI and open the SASpy dialog'''
+    from . import gui
+    return gui.SASpy(app)
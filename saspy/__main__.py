@@ -0,0 +1,11 @@
+# python lib
+'''
+SASpy batch runner, see saspy.batch
+
+USAGE: python -m saspy manifest.json [-o summary.json] [--workers N]
+'''
+import sys
+
+from .batch import main
+
+sys.exit(main())
@@ -0,0 +1,265 @@
+# python lib
+'''
+SASpy - ATSAS PLUGIN FOR PYMOL
+
+Batch runner: runs structures x datasets x procedures from a manifest
+through the job engine, without opening any viewer, and writes a JSON
+summary of all results.
+
+USAGE: python -m saspy manifest.json [-o summary.json] [--workers N]
+   or: pymol -cq -d "import saspy" -d "saspy_batch manifest.json"
+
+The manifest is a JSON object, relative paths are relative to it:
+
+{
+  "structures": ["models/*.pdb", "ref.pdb"],
+  "datasets":   ["data/sample1.dat", "data/sample2.dat"],
+  "procedures": ["fitcrysol", {"name": "sasref", "mode": "global"}],
+  "output":     "results",
+  "summary":    "summary.json",
+  "workers":    8
+}
+
+Procedures: predcrysol (per structure), fitcrysol and sreflex (per
+structure and dataset), sasref (per dataset, all structures are the
+subunits; every run moves its own copies of them, named after the
+structure and dataset). Procedure options: hydrogens (yes/no) and param for the
+CRYSOL procedures, mode and starts for sasref.
+
+(c) 2015-2019 A.PANJKOVICH AND H.MERTENS FOR ATSAS TEAM AT EMBL-HAMBURG.
+'''
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+from pymol import cmd
+
+from .core import (saspyVersion, defprefix, message, jobEngine, runCrysol,
+                   destFile, moveToClaimed, TemporaryDirectory, sasref,
+                   sreflex, recordResult)
+
+batchProcedures = ('predcrysol', 'fitcrysol', 'sreflex', 'sasref')
+
+def crysolTask(structure, dataset, outdir, hydrogens = 'no', param = ''):
+    '''Run CRYSOL for one structure, fitting dataset if given'''
+    options = param.split()
+    if 'yes' == hydrogens:
+        options = ["-eh"] + options
+    with TemporaryDirectory() as tmpdir:
+        pdbfn = tmpdir.writePdb(structure)
+        result = runCrysol(options, pdbfn, dataset, cwd=tmpdir.temp_dir)
+        fid = pdbfn.replace(".pdb", "")
+        outputs = [('int', '00.int', '.int')]
+        if dataset is None:
+            result['chi2'] = None
+        else:
+            outputs = [('fit', '00.fit', '.fit'), ('log', '00.log', '.log')]
+        name = fid
+        if dataset is not None:
+            name += "_" + os.path.splitext(os.path.basename(dataset))[0]
+        for key, suffix, ext in outputs:
+            result[key] = destFile(outdir, name, ext)
+            moveToClaimed(os.path.join(tmpdir.temp_dir, fid + suffix),
+                          result[key])
+    recordResult('fitcrysol' if dataset else 'predcrysol', structure,
+                 dataset, result['inputHash'],
+                 {'hydrogens':hydrogens, 'param':param}, result['chi2'],
+                 result['Rg'], result['eDens'],
+                 output=result.get('fit') or result.get('int'))
+    return result
+
+def objectName(fn, taken):
+    #PyMOL object names without the characters SASpy can not handle
+    name = os.path.splitext(os.path.basename(fn))[0]
+    for c in "_. -":
+        name = name.replace(c, "")
+    name = name or "model"
+    unique = name
+    count = 1
+    while unique in taken:
+        count += 1
+        unique = name + repr(count)
+    taken.add(unique)
+    return unique
+
+def expandPaths(patterns, base):
+    paths = []
+    for pattern in patterns:
+        pattern = os.path.join(base, pattern)
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise ValueError("no file matches \'" + pattern + "\'")
+        paths.extend([os.path.abspath(fn) for fn in matches])
+    return paths
+
+def readManifest(manifestfn):
+    '''Read a manifest, return it with absolute paths'''
+    with open(manifestfn, 'r') as rf:
+        manifest = json.load(rf)
+    base = os.path.dirname(os.path.abspath(manifestfn))
+    manifest['structures'] = expandPaths(manifest.get('structures', []), base)
+    manifest['datasets'] = expandPaths(manifest.get('datasets', []), base)
+    procedures = []
+    for proc in manifest.get('procedures', []):
+        if not isinstance(proc, dict):
+            proc = {'name': proc}
+        if proc['name'] not in batchProcedures:
+            raise ValueError("unknown procedure \'" + proc['name']
+                             + "\', use one of " + ", ".join(batchProcedures))
+        procedures.append(proc)
+    manifest['procedures'] = procedures
+    manifest['output'] = os.path.abspath(os.path.join(base,
+                                         manifest.get('output', '.')))
+    manifest['summary'] = os.path.join(manifest['output'],
+                                       manifest.get('summary', 'summary.json'))
+    return manifest
+
+def subunitCopies(names, dataset):
+    #copies of the loaded structures named after the dataset
+    taken = set(cmd.get_object_list())
+    tag = objectName(dataset, set())
+    copies = []
+    for s in names:
+        copy = objectName(s + tag, taken)
+        cmd.create(copy, s)
+        copies.append(copy)
+    return copies
+
+def batchTasks(manifest, names):
+    '''Expand the manifest into (procedure, structures, dataset, func, args)'''
+    outdir = manifest['output']
+    tasks = []
+    for proc in manifest['procedures']:
+        name = proc['name']
+        hydrogens = proc.get('hydrogens', 'no')
+        param = proc.get('param', '')
+        if 'predcrysol' == name:
+            for s in names:
+                tasks.append((name, [s], None, crysolTask,
+                              (s, None, outdir, hydrogens, param)))
+        elif 'fitcrysol' == name:
+            for s in names:
+                for d in manifest['datasets']:
+                    tasks.append((name, [s], d, crysolTask,
+                                  (s, d, outdir, hydrogens, param)))
+        elif 'sreflex' == name:
+            for s in names:
+                for d in manifest['datasets']:
+                    tasks.append((name, [s], d, sreflex,
+                                  (d, [s], '', defprefix, outdir)))
+        elif 'sasref' == name:
+            for d in manifest['datasets']:
+                #sasref moves the subunits, every run gets its own copies
+                subunits = subunitCopies(names, d)
+                tasks.append((name, list(names), d, sasref,
+                              (d, subunits, proc.get('mode', 'local'), '',
+                               proc.get('starts', 1), 0, outdir)))
+    return tasks
+
+def writeSummary(summary, fn):
+    #write atomically, a nightly job may be read while it runs
+    tmpfn = fn + ".tmp"
+    with open(tmpfn, 'w') as wf:
+        json.dump(summary, wf, indent=2, sort_keys=True)
+    if "win32" == sys.platform and os.path.exists(fn):
+        os.remove(fn) #rename does not replace files on Windows
+    os.rename(tmpfn, fn)
+
+def runBatch(manifestfn, summaryfn = None, workers = 0):
+    '''Run all tasks of a manifest, return the summary
+
+    Procedures run concurrently in the job engine, no viewer is opened.
+    Outputs go to the output folder of the manifest, the summary to
+    summaryfn (default: summary.json in the output folder).
+    '''
+    manifest = readManifest(manifestfn)
+    if summaryfn:
+        manifest['summary'] = os.path.abspath(summaryfn)
+    if not os.path.isdir(manifest['output']):
+        os.makedirs(manifest['output'])
+    #0 runs one job per core
+    jobEngine.setWorkers(int(workers or manifest.get('workers', 0)))
+
+    taken = set(cmd.get_object_list())
+    names = []
+    files = {}
+    for fn in manifest['structures']:
+        name = objectName(fn, taken)
+        cmd.load(fn, name)
+        names.append(name)
+        files[name] = fn
+
+    tasks = batchTasks(manifest, names)
+    message("Batch: " + repr(len(tasks)) + " tasks, " + repr(len(names))
+            + " structures, " + repr(len(manifest['datasets']))
+            + " datasets, " + repr(jobEngine.maxWorkers) + " concurrent jobs")
+    started = time.time()
+    jobs = [jobEngine.submit(proc, func, args)
+            for proc, structures, dataset, func, args in tasks]
+    entries = []
+    for (proc, structures, dataset, func, args), job in zip(tasks, jobs):
+        job.wait()
+        entry = {'procedure': proc,
+                 'structures': [files[s] for s in structures],
+                 'dataset': dataset,
+                 'state': job.state,
+                 'seconds': (job.finished or time.time()) - (job.started
+                                                            or started)}
+        if 'done' == job.state and isinstance(job.result, dict):
+            entry['result'] = job.result
+        elif 'done' == job.state:
+            #procedures return error codes on wrong input or missing output
+            entry['state'] = 'failed'
+            entry['error'] = 'returned ' + repr(job.result)
+        elif 'done' != job.state:
+            entry['error'] = job.error
+        entries.append(entry)
+        message("Batch [" + repr(len(entries)) + "/" + repr(len(tasks)) + "] "
+                + proc + " " + " ".join(structures) + " "
+                + os.path.basename(dataset or "") + ": " + entry['state'])
+
+    failed = len([e for e in entries if 'done' != e['state']])
+    summary = {'saspy_version': saspyVersion,
+               'manifest': os.path.abspath(manifestfn),
+               'output': manifest['output'],
+               'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                        time.localtime(started)),
+               'seconds': time.time() - started,
+               'tasks': len(entries),
+               'failed': failed,
+               'results': entries}
+    writeSummary(summary, manifest['summary'])
+    message("Batch finished, " + repr(len(entries) - failed) + " of "
+            + repr(len(entries)) + " tasks done, summary written to "
+            + manifest['summary'])
+    return summary
+
+def saspyBatch(manifest, summary = '', workers = 0):
+    '''Run a batch manifest, see saspy.batch
+
+    USAGE: saspy_batch manifest.json [, summary.json [, workers]]
+    '''
+    try:
+        return runBatch(manifest, summary, int(workers))
+    except (IOError, OSError, ValueError, KeyError) as e:
+        message("ERROR batch manifest \'" + manifest + "\': " + str(e))
+
+cmd.extend("saspy_batch", saspyBatch)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='python -m saspy',
+                                     description='Run a SASpy batch manifest')
+    parser.add_argument('manifest', help='JSON manifest')
+    parser.add_argument('-o', '--summary', default='',
+                        help='JSON summary (default: in the output folder)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='concurrent jobs (default: from the manifest, '
+                             'or one per core)')
+    opts = parser.parse_args(argv)
+    summary = saspyBatch(opts.manifest, opts.summary, opts.workers)
+    if summary is None:
+        return 2
+    return 1 if summary['failed'] else 0
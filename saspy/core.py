@@ -0,0 +1,2817 @@
+# python lib
+'''
+SASpy - ATSAS PLUGIN FOR PYMOL
+
+Core: the ATSAS procedures and their PyMOL commands. This module does
+not import Tk or Pmw, so it can be used in headless PyMOL (pymol -cq).
+
+(c) 2015-2019 A.PANJKOVICH AND H.MERTENS FOR ATSAS TEAM AT EMBL-HAMBURG.
+'''
+import os
+import sys
+import re
+import time
+import shutil
+import string
+import math
+import random
+
+import tempfile
+import threading
+import subprocess
+import signal
+import itertools
+import hashlib
+import heapq
+import collections
+import json
+import multiprocessing
+import mmap
+import atexit
+import errno
+import getpass
+import stat
+
+try:
+    import queue # python 3
+except ImportError:
+    import Queue as queue # python 2
+
+
+# pymol lib
+from pymol import cmd
+from pymol.cgo import *
+
+from .results import ResultsStore, toJson
+from . import transforms
+
+## Check the PYTHON version used by PYMOL
+pymolVersion = str(sys.version)
+pythonVersion = 3 if pymolVersion.startswith('3') else 2
+
+#global variables
+saspyVersion = "3.1.0"
+
+from sys import platform
+
+class TemporaryDirectory:
+    """Context Manager for working in a temporary directory
+
+    The process working directory is never changed, as it is shared by
+    the GUI and all jobs: files are addressed with path(), PDB files
+    written with writePdb() and external programs started with run(),
+    which sets the directory as their working directory.
+    Without an explicit parent directory, the directory is taken from
+    the workspace pool and given back to it on exit.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.orig_dir = os.getcwd()
+        self.pooled = 3 > len(args) and 'dir' not in kwargs
+        if self.pooled:
+            self.temp_dir = workspacePool.acquire(*args, **kwargs)
+        else:
+            self.temp_dir = tempfile.mkdtemp(*args, **kwargs)
+
+    def __enter__(self):
+        self.orig_dir = os.getcwd()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # If there was an error, do not delete the temporary
+        # directory, so that the user can examine its contents
+        self.cleanup(exc_type is not None
+                     and not issubclass(exc_type, JobCancelled))
+
+    def cleanup(self, failed = False):
+        """Remove the directory, or keep it for inspection if failed"""
+        if self.pooled:
+            workspacePool.release(self.temp_dir, failed)
+        elif not failed:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def path(self, name):
+        """Absolute path of name in the temporary directory"""
+        return os.path.join(self.temp_dir, name)
+
+    def writePdb(self, sel, prefix = "", state = -1):
+        """Save sel into the temporary directory, return the file name"""
+        return os.path.basename(writePdb(sel, prefix, self.temp_dir, state))
+
+    def run(self, command, **kwargs):
+        """Run an external program in the temporary directory"""
+        return systemCommand(command, cwd=self.temp_dir, **kwargs)
+
+    def copy_in(self, src, dst=None):
+        """Copy a file into the temporary directory
+
+        Arguments:
+        src -- Source file name (relative to the original working directory)
+        dst -- Destination file name (relative to the temporary directory)
+               If not present, same as the source file name
+        """
+        if dst is None:
+            dst = src
+        if os.path.isabs(dst):
+            raise ValueError("Destination path should not be absolute")
+        abs_src = os.path.join(self.orig_dir, src)
+        abs_dst = os.path.join(self.temp_dir, dst)
+        shutil.copy(abs_src, abs_dst)
+        return abs_dst
+
+    def move_out(self, src, dst=None):
+        """Move a file out of the temporary directory
+
+        Arguments:
+        src -- Source file name (relative to the temporary directory)
+        dst -- Destination file name (relative to the original directory)
+               If not present, same as the source file name
+        """
+        if os.path.isabs(src):
+            raise ValueError("Source path should not be absolute")
+        if dst is None:
+            dst = src
+        abs_src = os.path.join(self.temp_dir, src)
+        abs_dst = os.path.join(self.orig_dir, dst)
+        moveOut(abs_src, abs_dst)
+        return abs_dst
+
+    def move_out_numbered(self, src, prefix, suffix, folder = None):
+        """Move a file out of the temporary directory, without overwriting old files
+
+        Chooses a new file name based on the given prefix and suffix and a unique number
+
+        Arguments:
+        src -- Source file name (relative to the temporary directory)
+        prefix -- prefix for the destination filename
+        suffix -- suffix for the destination filename
+        folder -- destination folder, default the original directory
+        """
+        if os.path.isabs(src):
+            raise ValueError("Source path should not be absolute")
+        if not suffix.startswith('.'):
+            suffix = '.' + suffix
+        abs_src = os.path.join(self.temp_dir, src)
+        #the claimed (empty) destination is replaced by the move
+        abs_dst = destFile(folder or self.orig_dir, prefix, suffix)
+        moveToClaimed(abs_src, abs_dst)
+        return abs_dst
+
+def moveToClaimed(src, dst):
+    #move onto a name claimed with destFile, not leaving the empty
+    #placeholder behind if the move fails (e.g. the tool wrote no src)
+    try:
+        moveOut(src, dst)
+    except (IOError, OSError):
+        if os.path.isfile(dst):
+            os.remove(dst)
+        raise
+
+def moveOut(src, dst):
+    #files linked from the PDB stage are read-only and shared,
+    #the user gets a private, writable copy of them
+    if 1 < os.stat(src).st_nlink:
+        tmp = dst + '.tmp%d' % threading.current_thread().ident
+        shutil.copyfile(src, tmp)
+        os.remove(src)
+        shutil.move(tmp, dst)
+    else:
+        shutil.move(src, dst)
+
+
+##################
+# CLI Funtions
+
+defprefix = 'saspy_wd'
+
+class LocalExecutor:
+    """Runs ATSAS programs as child processes on the PyMOL host"""
+
+    name = 'local'
+
+    def run(self, command, **kwargs):
+        #the child gets its own process group, so that cancelling a job
+        #also ends the processes started by the ATSAS tool itself
+        job = currentJob()
+        if "win32" == platform:
+            kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        elif pythonVersion == 3:
+            kwargs['start_new_session'] = True
+        else:
+            kwargs['preexec_fn'] = os.setsid
+        #inside a job, the output is read as it comes, to follow progress
+        capture = job is not None and 'stdout' not in kwargs
+        if capture:
+            kwargs['stdout'] = subprocess.PIPE
+            kwargs['stderr'] = subprocess.PIPE
+        proc = subprocess.Popen(command, **kwargs)
+        if job is None:
+            return proc.wait()
+        readers = []
+        if capture:
+            readers = [streamOutput(proc.stdout, job),
+                       streamOutput(proc.stderr, job)]
+        try:
+            return job.waitProcess(proc)
+        finally:
+            for t in readers:
+                t.join(5.0)
+
+localExecutor = LocalExecutor()
+
+#executor of every ATSAS program that does not run locally,
+#see saspy.executors
+toolExecutors = {}
+
+def commandTool(command):
+    #name of the program of an argument list or shell command line
+    if isinstance(command, str):
+        command = command.split()
+    return os.path.basename(command[0]) if command else ''
+
+def systemCommand(command, **kwargs):
+    '''Run an ATSAS program with the executor configured for it
+
+    The keyword arguments are those of subprocess.Popen (cwd, stdin,
+    shell, ...). Returns the exit status.
+    '''
+    job = currentJob()
+    if job is not None:
+        job.checkCancelled()
+    executor = toolExecutors.get(commandTool(command), localExecutor)
+    status = executor.run(command, **kwargs)
+    if(0 != status):
+        if not isinstance(command, str):
+            command = ' '.join(command)
+        message("WARNING, something went wrong while executing:\n"
+                + command)
+    return status
+
+def streamOutput(pipe, job):
+    #tail a pipe of a child process in a thread, echo it to the
+    #terminal and pass every line to the job
+    def reader():
+        for line in iter(pipe.readline, b''):
+            line = line.decode('utf-8', 'replace')
+            sys.stdout.write(line)
+            job.addOutput(line)
+        pipe.close()
+    t = threading.Thread(target = reader, name = 'saspy_output')
+    t.daemon = True
+    t.start()
+    return t
+
+def killProcessGroup(proc):
+    #terminate a child started by systemCommand and all its children
+    if proc.poll() is not None:
+        return
+    try:
+        if "win32" == platform:
+            subprocess.call(["taskkill", "/F", "/T", "/PID", repr(proc.pid)])
+            return
+        os.killpg(proc.pid, signal.SIGTERM)
+        for i in range(20):
+            if proc.poll() is not None:
+                return
+            time.sleep(0.1)
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        #the process group is already gone
+        pass
+
+def message(text):
+    print("SASpy: "+text)
+    return
+
+def defaultWorkers():
+    #number of ATSAS processes to run concurrently
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+def runParallel(func, items, workers = 0, backlog = 0):
+    '''Call func for every item in a bounded pool of worker threads
+
+    Each call typically waits for an ATSAS subprocess, so at most
+    workers processes run at once (one per core if 0). items may be a
+    generator: it is consumed in the calling thread, never more than
+    backlog items (default: workers) ahead of the pool. Returns the
+    results in the order of items, None where func raised an exception.
+    '''
+    workers = int(workers)
+    if 1 > workers:
+        workers = defaultWorkers()
+    backlog = int(backlog)
+    if 1 > backlog:
+        backlog = workers
+    pending = queue.Queue(backlog)
+    results = {}
+    job = currentJob()
+    cancelled = []
+
+    def worker():
+        #the pool belongs to the job of the calling thread
+        jobContext.job = job
+        while True:
+            entry = pending.get()
+            if entry is None:
+                break
+            idx, item = entry
+            try:
+                results[idx] = func(item)
+            except JobCancelled as e:
+                #keep draining, so every item can clean up after itself
+                cancelled.append(e)
+                results[idx] = None
+            except Exception as e:
+                message("ERROR in parallel job " + repr(idx) + ": " + repr(e))
+                results[idx] = None
+
+    threads = []
+    for i in range(workers):
+        t = threading.Thread(target = worker, name = 'saspy_worker'+repr(i))
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    count = 0
+    for item in items:
+        pending.put((count, item))
+        count += 1
+        if job is not None and job.cancelEvent.is_set():
+            break
+    for t in threads:
+        pending.put(None)
+    for t in threads:
+        t.join()
+    if 0 < len(cancelled):
+        raise cancelled[0]
+    return [results.get(i) for i in range(count)]
+
+def selectionList(models):
+    #models may be given as a list or, from the PyMOL command line,
+    #as a string of space separated object names
+    if isinstance(models, str):
+        models = models.split()
+    if 0 == len(models):
+        models = cmd.get_object_list()
+    return list(models)
+
+## Job engine
+
+class MainLoopDispatcher:
+    """Marshal PyMOL side effects of background jobs onto the main loop
+
+    Once a Tk widget is attached, calls made from other threads are
+    queued and executed by polling from the Tk main loop. Without a GUI,
+    or from the main thread itself, calls are executed right away.
+    """
+
+    def __init__(self):
+        self.calls = queue.Queue()
+        self.widget = None
+        self.mainThread = threading.current_thread()
+
+    def attach(self, widget, interval = 100):
+        if self.widget is None:
+            self.widget = widget
+            widget.after(interval, self.poll, interval)
+
+    def poll(self, interval):
+        self.process()
+        try:
+            self.widget.after(interval, self.poll, interval)
+        except Exception:
+            #the widget is gone, fall back to direct calls
+            self.widget = None
+            self.process()
+
+    def process(self):
+        while True:
+            try:
+                func, args, kwargs, done, box = self.calls.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                box.append(func(*args, **kwargs))
+            except Exception as e:
+                message("ERROR while updating PyMOL: " + repr(e))
+                box.append(None)
+            if done is not None:
+                done.set()
+
+    def direct(self):
+        return (self.widget is None
+                or threading.current_thread() is self.mainThread)
+
+    def call(self, func, *args, **kwargs):
+        """Schedule func on the main loop without waiting for it"""
+        if self.direct():
+            return func(*args, **kwargs)
+        self.calls.put((func, args, kwargs, None, []))
+
+    def callAndWait(self, func, *args, **kwargs):
+        """Run func on the main loop and return its result
+
+        Needed when func reads files that the job is about to remove.
+        """
+        if self.direct():
+            return func(*args, **kwargs)
+        done = threading.Event()
+        box = []
+        self.calls.put((func, args, kwargs, done, box))
+        done.wait()
+        return box[0]
+
+mainLoop = MainLoopDispatcher()
+
+class JobCancelled(Exception):
+    """Raised inside a job that was cancelled or ran out of time"""
+    pass
+
+jobContext = threading.local()
+
+def currentJob():
+    #the Job executed by the calling thread, None outside the job engine
+    return getattr(jobContext, 'job', None)
+
+def recordResult(procedure, model, dataset = None, inputHash = None,
+                 parameters = None, chi2 = None, Rg = None, eDens = None,
+                 nsd = None, output = None):
+    '''Record a result in the results store
+
+    Inside the job engine the result is kept with the job and stored
+    together with it when the job finishes.
+    '''
+    row = {'procedure':procedure, 'model':model, 'dataset':dataset,
+           'input_hash':inputHash, 'chi2':chi2, 'rg':Rg, 'edens':eDens,
+           'nsd':nsd, 'output':output, 'created':time.time()}
+    if parameters is not None:
+        row['parameters'] = toJson(parameters)
+    job = currentJob()
+    if job is None:
+        resultsStore.add(None, [row])
+        return
+    row['job'] = job.id
+    with job.lock:
+        job.results.append(row)
+
+class Job:
+    """A procedure submitted to the job engine, with its state and timing
+
+    The child processes started by the job are kept, so that the job can
+    be cancelled, or stopped after timeout seconds (0 for no limit).
+    Their output is collected in log, and the annealing temperature,
+    iteration and chi2 printed by SASREF/SREFLEX are tracked in progress,
+    with every reported chi2 appended to trace.
+    """
+
+    #number of output lines kept per job
+    logLines = 1000
+
+    #progress reported by the ATSAS tools, e.g. 'T= 0.1E+02 Iter= 3 Fit: 1.2'
+    number = r'\s*[=:]\s*([-+]?\d+\.?\d*(?:[eEdD][-+]?\d+)?)'
+    progressPatterns = (
+        ('temperature', re.compile(r'\b(?:T|Temp|Temperature)' + number, re.I)),
+        ('iteration', re.compile(r'\b(?:Iter|Iteration|Step)' + number, re.I)),
+        ('chi2', re.compile(r'(?:Chi\^?2|Chi-square|Chi2|\bFit)' + number, re.I)),
+    )
+
+    def __init__(self, jobid, name, func, args, priority, timeout = 0):
+        self.id = jobid
+        self.name = name
+        self.func = func
+        self.args = args
+        self.priority = priority
+        self.timeout = timeout
+        self.state = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.cancelEvent = threading.Event()
+        self.finishedEvent = threading.Event()
+        self.reason = 'cancelled'
+        self.processes = []
+        self.lock = threading.Lock()
+        self.log = collections.deque(maxlen = self.logLines)
+        self.progress = {}
+        self.trace = []
+        self.results = []
+
+    def addOutput(self, line):
+        """Record a line printed by a child process and parse progress"""
+        found = {}
+        for key, pattern in self.progressPatterns:
+            m = pattern.search(line)
+            if m:
+                found[key] = float(m.group(1).replace('D', 'E')
+                                            .replace('d', 'e'))
+        with self.lock:
+            self.log.append(line)
+            self.progress.update(found)
+            if 'chi2' in found:
+                self.trace.append((len(self.trace) + 1, found['chi2']))
+
+    def progressText(self):
+        with self.lock:
+            progress = dict(self.progress)
+        out = []
+        if 'temperature' in progress:
+            out.append("T=%.3g" % progress['temperature'])
+        if 'iteration' in progress:
+            out.append("it=%d" % progress['iteration'])
+        if 'chi2' in progress:
+            out.append("chi2=%.4g" % progress['chi2'])
+        return ' '.join(out)
+
+    def wait(self, timeout = None):
+        """Wait until the job has finished, return False on timeout"""
+        return self.finishedEvent.wait(timeout)
+
+    def cancel(self, reason = 'cancelled'):
+        """Stop the job and end its running processes right away"""
+        with self.lock:
+            if self.cancelEvent.is_set():
+                return
+            self.reason = reason
+            self.cancelEvent.set()
+            processes = list(self.processes)
+        for proc in processes:
+            killProcessGroup(proc)
+
+    def checkCancelled(self):
+        if (0 < self.timeout and self.started is not None
+                and time.time() - self.started > self.timeout):
+            self.cancel('timed out after %gs' % self.timeout)
+        if self.cancelEvent.is_set():
+            raise JobCancelled(self.reason)
+
+    def waitProcess(self, proc):
+        """Wait for a child process, ending it if the job is stopped"""
+        with self.lock:
+            self.processes.append(proc)
+        if self.cancelEvent.is_set():
+            killProcessGroup(proc)
+        try:
+            while proc.poll() is None:
+                try:
+                    self.checkCancelled()
+                except JobCancelled:
+                    killProcessGroup(proc)
+                    proc.wait()
+                    raise
+                self.cancelEvent.wait(0.2)
+        finally:
+            with self.lock:
+                self.processes.remove(proc)
+        self.checkCancelled()
+        return proc.returncode
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        if self.finished is None:
+            return time.time() - self.started
+        return self.finished - self.started
+
+    def exitStatus(self):
+        if self.error is not None:
+            return self.error
+        if 'done' == self.state and self.result is not None:
+            return repr(self.result)
+        return ''
+
+class JobEngine:
+    """Schedule ATSAS procedures on a bounded number of worker threads
+
+    Jobs wait in a pending queue, highest priority first and in order of
+    submission within a priority, and are started as soon as fewer than
+    maxWorkers jobs are running. PyMOL side effects of the procedures go
+    through mainLoop. Queued and running jobs are kept by id; of the
+    finished ones, which are in the results store, only the last
+    keepFinished are kept for the job table.
+    """
+
+    def __init__(self, maxWorkers = 1, keepFinished = 200):
+        self.maxWorkers = maxWorkers
+        self.defaultTimeout = 0
+        self.lock = threading.Lock()
+        self.pending = []
+        self.active = collections.OrderedDict()
+        self.finished = collections.deque(maxlen = keepFinished)
+        self.workers = 0
+        self.counter = itertools.count(1)
+
+    def submit(self, name, func, args = (), priority = 0, timeout = None):
+        """Queue func(*args) and return its Job
+
+        timeout is the wall-clock limit in seconds once the job started,
+        by default defaultTimeout, 0 for no limit.
+        """
+        if timeout is None:
+            timeout = self.defaultTimeout
+        with self.lock:
+            job = Job(next(self.counter), name, func, args, int(priority),
+                      float(timeout))
+            self.active[job.id] = job
+            heapq.heappush(self.pending, (-job.priority, job.id, job))
+            busy = self.workers >= self.maxWorkers
+            self.spawnWorkers()
+        if busy:
+            message("Job " + repr(job.id) + " \'" + name + "\' queued")
+        return job
+
+    def setWorkers(self, maxWorkers):
+        """Change the number of jobs that may run at the same time"""
+        maxWorkers = int(maxWorkers)
+        if 1 > maxWorkers:
+            maxWorkers = defaultWorkers()
+        with self.lock:
+            self.maxWorkers = maxWorkers
+            self.spawnWorkers()
+        message("Up to " + repr(maxWorkers) + " jobs will run concurrently")
+
+    def spawnWorkers(self):
+        #called with the lock held
+        while self.workers < min(self.maxWorkers, len(self.pending)):
+            self.workers += 1
+            t = threading.Thread(target = self.run, name = 'saspy_jobs')
+            t.daemon = True
+            t.start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if 0 == len(self.pending) or self.workers > self.maxWorkers:
+                    self.workers -= 1
+                    return
+                job = heapq.heappop(self.pending)[2]
+                if 'queued' != job.state:
+                    #cancelled while waiting
+                    continue
+                job.state = 'running'
+                job.started = time.time()
+            message("Job " + repr(job.id) + " \'" + job.name + "\' started")
+            jobContext.job = job
+            try:
+                job.checkCancelled()
+                job.result = job.func(*job.args)
+                job.state = 'done'
+                message("Job " + repr(job.id) + " \'" + job.name
+                        + "\' finished")
+            except JobCancelled as e:
+                job.error = str(e)
+                job.state = 'cancelled'
+                if job.reason.startswith('timed out'):
+                    job.state = 'timeout'
+                message("Job " + repr(job.id) + " \'" + job.name
+                        + "\' " + job.error)
+            except Exception as e:
+                job.error = repr(e)
+                job.state = 'failed'
+                message("ERROR job " + repr(job.id) + " \'" + job.name
+                        + "\' failed: " + job.error)
+            jobContext.job = None
+            self.retire(job)
+
+    def retire(self, job):
+        #move a job that has ended to the finished ones and store it
+        job.finished = time.time()
+        with self.lock:
+            self.active.pop(job.id, None)
+            dropped = None
+            if len(self.finished) == self.finished.maxlen:
+                dropped = self.finished[0]
+            self.finished.append(job)
+        if dropped is not None:
+            #no longer listed, neither are its outputs
+            session.forget(dropped.id)
+        self.store(job)
+        job.finishedEvent.set()
+
+    def store(self, job):
+        #one run row plus its results, written in bulk once idle
+        run = {'job':job.id, 'procedure':job.name,
+               'parameters':toJson(job.args), 'state':job.state,
+               'error':job.error, 'submitted':job.submitted,
+               'started':job.started, 'finished':job.finished,
+               'seconds':job.elapsed()}
+        with job.lock:
+            results, job.results = job.results, []
+        for r in results:
+            r.setdefault('parameters', run['parameters'])
+        try:
+            resultsStore.add(run, results)
+            if not self.activeJobs():
+                resultsStore.flush()
+        except Exception as e:
+            message("WARNING, could not store the results of job "
+                    + repr(job.id) + ": " + repr(e))
+
+    def activeJobs(self):
+        with self.lock:
+            return list(self.active.values())
+
+    def cancel(self, jobid):
+        """Cancel a queued or running job, return False if there is none"""
+        job = self.get(jobid)
+        with self.lock:
+            if job is None or job.state not in ('queued', 'running'):
+                return False
+            queued = 'queued' == job.state
+            if queued:
+                job.state = 'cancelled'
+                job.error = 'cancelled'
+                job.cancelEvent.set()
+        if queued:
+            self.retire(job)
+            return True
+        job.cancel()
+        return True
+
+    def table(self):
+        """Return a text table with state, elapsed time and exit status"""
+        out = "%4s  %-12s %9s %4s %9s  %-30s %s\n" % (
+              "Id", "Procedure", "State", "Prio", "Elapsed", "Progress",
+              "Exit status")
+        with self.lock:
+            jobs = list(self.finished) + list(self.active.values())
+        for j in sorted(jobs, key=lambda j: j.id):
+            out += "%4d  %-12s %9s %4d %8.1fs  %-30s %s\n" % (
+                   j.id, j.name, j.state, j.priority, j.elapsed(),
+                   j.progressText(), j.exitStatus())
+        return out
+
+    def get(self, jobid):
+        with self.lock:
+            if jobid in self.active:
+                return self.active[jobid]
+            for j in self.finished:
+                if j.id == jobid:
+                    return j
+        return None
+
+jobEngine = JobEngine()
+
+class Session:
+    """State of one SASpy session, shared by the GUI, commands and jobs
+
+    Run numbers (the N of sasrefN and sreflexN objects) are allocated
+    atomically, the outputs written by every job are registered under
+    its id (None outside jobs, the last keepOutputs of them), and the
+    latest curves, opened by the GUI, are replaced as a whole. The
+    outputs of a job are forgotten with the job, see JobEngine.retire.
+    All access goes through the lock.
+    """
+
+    def __init__(self, keepOutputs = 1000):
+        self.id = time.strftime('%Y%m%d-%H%M%S') + '-' + repr(os.getpid())
+        self.lock = threading.Lock()
+        self.runs = itertools.count(1)
+        self.outputs = {None:collections.deque(maxlen = keepOutputs)}
+        self.curves = []
+
+    def nextRun(self):
+        with self.lock:
+            return next(self.runs)
+
+    def register(self, path):
+        job = currentJob()
+        with self.lock:
+            self.outputs.setdefault(None if job is None else job.id,
+                                    []).append(path)
+
+    def jobOutputs(self, jobid = None):
+        with self.lock:
+            return list(self.outputs.get(jobid, []))
+
+    def forget(self, jobid):
+        with self.lock:
+            self.outputs.pop(jobid, None)
+
+    def setCurves(self, curves):
+        with self.lock:
+            self.curves = list(curves)
+
+    def latestCurves(self):
+        with self.lock:
+            return list(self.curves)
+
+session = Session()
+sessionId = session.id
+resultsStore = ResultsStore(os.path.join(os.path.expanduser('~'), '.saspy',
+                                         'results.sqlite'), sessionId)
+atexit.register(resultsStore.flush)
+
+def resultsTable(rows):
+    out = "%4s  %-12s %-20s %-16s %10s %8s %8s %8s  %s\n" % (
+          "Job", "Procedure", "Model", "Dataset", "Chi2", "Rg", "eDens",
+          "NSD", "Output")
+    fmt = lambda v, f: f % v if v is not None else '-'
+    for r in rows:
+        out += "%4s  %-12s %-20s %-16s %10s %8s %8s %8s  %s\n" % (
+               fmt(r['job'], '%d'), r['procedure'], r['model'],
+               os.path.basename(r['dataset'] or '') or '-',
+               fmt(r['chi2'], '%.4g'), fmt(r['rg'], '%.2f'),
+               fmt(r['edens'], '%.3f'), fmt(r['nsd'], '%.3f'),
+               r['output'] or '')
+    return out
+
+def saspyBest(procedure = '', metric = 'chi2', limit = 10, session = ''):
+    '''Show the stored results with the lowest chi2 (or rg, edens, nsd)
+
+    USAGE: saspy_best [procedure [, metric [, limit [, session]]]]
+    Results of the current session are shown, session 'all' for all.
+    '''
+    try:
+        rows = resultsStore.best(procedure, metric, limit, session or None)
+    except ValueError as e:
+        message("ERROR " + str(e))
+        return
+    sys.stdout.write(resultsTable(rows))
+    return rows
+
+cmd.extend("saspy_best", saspyBest)
+
+def saspyRuns(limit = 20, session = ''):
+    '''Show the most recent stored runs
+
+    USAGE: saspy_runs [limit [, session]]
+    '''
+    rows = resultsStore.listRuns(limit, session or None)
+    out = "%4s  %-12s %9s %9s  %-19s  %s\n" % (
+          "Job", "Procedure", "State", "Seconds", "Started", "Error")
+    for r in rows:
+        started = time.strftime('%Y-%m-%d %H:%M:%S',
+                                time.localtime(r['started'] or r['submitted']))
+        out += "%4d  %-12s %9s %9.1f  %-19s  %s\n" % (
+               r['job'], r['procedure'], r['state'], r['seconds'] or 0,
+               started, r['error'] or '')
+    sys.stdout.write(out)
+    return rows
+
+cmd.extend("saspy_runs", saspyRuns)
+
+def saspyJobs():
+    '''List the SASpy jobs with their state, elapsed time and exit status'''
+    sys.stdout.write(jobEngine.table())
+
+cmd.extend("saspy_jobs", saspyJobs)
+
+def saspyOutputs(jobid = ''):
+    '''List the output files written by a SASpy job
+
+    USAGE: saspy_outputs [job]
+    Without a job id, the outputs written outside jobs are listed.
+    '''
+    outputs = session.jobOutputs(int(jobid) if '' != str(jobid) else None)
+    for fn in outputs:
+        message(fn)
+    return outputs
+
+cmd.extend("saspy_outputs", saspyOutputs)
+
+def saspyWorkers(n = 0):
+    '''Set the number of SASpy jobs that may run at the same time
+
+    USAGE: saspy_workers n
+    n = 0 uses one job per core.
+    '''
+    jobEngine.setWorkers(n)
+
+cmd.extend("saspy_workers", saspyWorkers)
+
+def saspyCancel(job = 'all'):
+    '''Cancel a queued or running SASpy job, ending its processes
+
+    USAGE: saspy_cancel [job id|all]
+    '''
+    if 'all' == str(job):
+        ids = [j.id for j in jobEngine.activeJobs()]
+    else:
+        ids = [int(job)]
+    for jobid in ids:
+        if jobEngine.cancel(jobid):
+            message("Job " + repr(jobid) + " cancelled")
+        else:
+            message("ERROR no queued or running job " + repr(jobid))
+
+cmd.extend("saspy_cancel", saspyCancel)
+
+def saspyProgress(job, lines = 10):
+    '''Show the progress, the chi2 trace and the last output of a job
+
+    USAGE: saspy_progress job id [, number of output lines]
+    '''
+    j = jobEngine.get(int(job))
+    if j is None:
+        message("ERROR no job " + repr(job))
+        return
+    message("Job " + repr(j.id) + " \'" + j.name + "\' " + j.state + ", "
+            + "%.1fs " % j.elapsed() + j.progressText())
+    with j.lock:
+        trace = list(j.trace)
+        log = list(j.log)
+    for step, chi2 in trace:
+        sys.stdout.write("%6d %12.5g\n" % (step, chi2))
+    lines = int(lines)
+    if 0 < lines:
+        for line in log[-lines:]:
+            sys.stdout.write(line)
+    return trace
+
+cmd.extend("saspy_progress", saspyProgress)
+
+def saspyTimeout(seconds = 0):
+    '''Set the wall-clock limit for new SASpy jobs
+
+    USAGE: saspy_timeout seconds
+    0 means no limit.
+    '''
+    jobEngine.defaultTimeout = float(seconds)
+    message("Timeout for new jobs: " + repr(jobEngine.defaultTimeout) + " s")
+
+cmd.extend("saspy_timeout", saspyTimeout)
+
+def crysolJob(crymode, crycalc, models, SaxsDataFileName, viewer):
+    '''Run CRYSOL in the given mode and show the resulting curve'''
+    df = 'empty'
+    if 'simulate' == crymode:
+        df = simulateScattering(crycalc, models)
+    if 'predict' == crymode:
+        df = predcrysol(crycalc, models)
+    elif 'fit' == crymode:
+        df = fitcrysol(crycalc, SaxsDataFileName, models)
+    elif 'batch' == crymode:
+        ranked = batchcrysol(crycalc, SaxsDataFileName, models)
+        if ranked:
+            #show the best fit only
+            df = ranked[0]['fit']
+    if 'empty' != df and df is not None:
+        mainLoop.call(openSingleDatFile, viewer, df)
+        updateCurrentDat(df)
+
+def getPlural(n):
+    #get plurals right
+    outstring = repr(n) +" model";
+    if 1 != n: 
+        outstring+='s'
+    return outstring   
+
+class OutputAllocator:
+    """Unique output names basename[_N]suffix, without probing
+
+    The next free number of every (folder, basename, suffix) is kept in
+    an index, filled by one directory listing on first use. Names are
+    claimed by creating them exclusively (O_EXCL, or mkdir for folders),
+    so concurrent jobs and other processes never get the same name; a
+    name taken by someone else only moves the counter on.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def scan(self, folder, basename, suffix):
+        #returns (next number, whether the unnumbered name is free)
+        pattern = re.compile(re.escape(basename) + r'_(\d+)'
+                             + re.escape(suffix) + '$')
+        last = 0
+        free = True
+        for fn in os.listdir(folder):
+            if fn == basename + suffix:
+                free = False
+                continue
+            m = pattern.match(fn)
+            if m:
+                last = max(last, int(m.group(1)))
+        return last + 1, free
+
+    def number(self, key, folder, basename, suffix):
+        #None stands for the unnumbered name
+        with self.lock:
+            n = self.counters.get(key)
+            if n is None:
+                n, free = self.scan(folder or '.', basename, suffix)
+                self.counters[key] = n
+                if free:
+                    return None
+            self.counters[key] = n + 1
+            return n
+
+    def claim(self, folder, basename, suffix, directory = False):
+        """Create and return a new file (or folder) named basename[_N]suffix"""
+        key = (os.path.abspath(folder), basename, suffix)
+        while True:
+            n = self.number(key, folder, basename, suffix)
+            name = basename + suffix
+            if n is not None:
+                name = basename + "_" + repr(n) + suffix
+            path = os.path.join(folder, name)
+            try:
+                if directory:
+                    os.mkdir(path)
+                else:
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL
+                                     | os.O_WRONLY, 0o666))
+                session.register(os.path.abspath(path))
+                return path
+            except OSError as e:
+                if errno.EEXIST != e.errno:
+                    raise
+
+    def reset(self, folder = None):
+        #forget the counters, e.g. after files were removed
+        with self.lock:
+            if folder is None:
+                self.counters.clear()
+                return
+            folder = os.path.abspath(folder)
+            for key in [k for k in self.counters if k[0] == folder]:
+                del self.counters[key]
+
+outputAllocator = OutputAllocator()
+
+def destFile(folder, basename, suffix, directory = False):
+    '''Claim a new output file (or folder) basename[_N]suffix in folder
+
+    The file is created empty, callers overwrite or move onto it.
+    '''
+    return outputAllocator.claim(folder, basename, suffix, directory)
+
+def scratchRoot():
+    '''Directory for short-lived files, RAM-backed (/dev/shm) if available'''
+    shm = '/dev/shm'
+    if "win32" != platform and os.path.isdir(shm) \
+            and os.access(shm, os.W_OK | os.X_OK):
+        return shm
+    return tempfile.gettempdir()
+
+def privateFolder(path):
+    #True if path is a folder of this user that nobody else can access,
+    #created if missing; a folder in /dev/shm or /tmp may be planted
+    try:
+        os.mkdir(path, 0o700)
+    except OSError as e:
+        if errno.EEXIST != e.errno:
+            return False
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        return False
+    if not hasattr(os, 'getuid'):
+        return True #Windows, the temporary folder is per user
+    return st.st_uid == os.getuid() and 0 == st.st_mode & 0o077
+
+def folderSize(folder):
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(folder):
+        for fn in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, fn)).st_size
+            except OSError:
+                pass
+    return size
+
+class WorkspacePool:
+    """Scratch directories for ATSAS runs, below scratchRoot()
+
+    Released workspaces are emptied and handed out again, at most
+    maxIdle of them are kept. The folder of the user is only used if
+    nobody else can access it, otherwise a new one is made per session.
+    Workspaces of failed runs are moved to failedRoot, on disk, for
+    inspection; the oldest are removed once they take more than
+    maxFailedSize bytes or are older than maxFailedAge seconds.
+    """
+
+    def __init__(self, maxIdle = 32, maxFailedSize = 512 * 1024 * 1024,
+                 maxFailedAge = 7 * 24 * 3600):
+        self.maxIdle = maxIdle
+        self.maxFailedSize = maxFailedSize
+        self.maxFailedAge = maxFailedAge
+        self.folder = None
+        self.temporary = False
+        self.failedRoot = os.path.join(os.path.expanduser('~'), '.saspy',
+                                       'failed_workspaces')
+        self.idle = []
+        self.created = 0
+        self.reused = 0
+        self.lock = threading.Lock()
+
+    def rootFolder(self):
+        with self.lock:
+            if self.folder is None:
+                #one folder per user, shared by the sessions of the user
+                folder = os.path.join(scratchRoot(),
+                                      'saspy_workspaces_' + getpass.getuser())
+                if not privateFolder(folder):
+                    message("WARNING, " + folder + " is not private, "
+                            "using a new workspace folder")
+                    folder = tempfile.mkdtemp(prefix='saspy_workspaces',
+                                              dir=scratchRoot())
+                    self.temporary = True
+                self.folder = folder
+                atexit.register(self.clear)
+            return self.folder
+
+    def failedFolder(self):
+        try:
+            os.makedirs(self.failedRoot, 0o700)
+        except OSError:
+            if not os.path.isdir(self.failedRoot):
+                raise
+        return self.failedRoot
+
+    def acquire(self, suffix = '', prefix = 'tmp'):
+        """Return an empty workspace"""
+        root = self.rootFolder()
+        with self.lock:
+            if self.idle:
+                self.reused += 1
+                return self.idle.pop()
+            self.created += 1
+        return tempfile.mkdtemp(suffix, prefix, root)
+
+    def release(self, path, failed = False):
+        """Give a workspace back, keeping its files if the run failed"""
+        if failed:
+            dst = os.path.join(self.failedFolder(), os.path.basename(path)
+                               + time.strftime('_%Y%m%d-%H%M%S'))
+            try:
+                #from the RAM-backed scratch folder to disk
+                shutil.move(path, dst)
+                message("Files of the failed run kept in " + dst)
+            except (IOError, OSError):
+                shutil.rmtree(path, ignore_errors=True)
+            self.prune()
+            return
+        try:
+            for fn in os.listdir(path):
+                fn = os.path.join(path, fn)
+                if os.path.isdir(fn) and not os.path.islink(fn):
+                    shutil.rmtree(fn)
+                else:
+                    os.remove(fn)
+        except OSError:
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        with self.lock:
+            if len(self.idle) < self.maxIdle:
+                self.idle.append(path)
+                return
+        os.rmdir(path)
+
+    def failed(self):
+        """(path, size, modification time) of the failed workspaces, oldest first"""
+        out = []
+        folder = self.failedFolder()
+        for fn in os.listdir(folder):
+            path = os.path.join(folder, fn)
+            try:
+                out.append((path, folderSize(path), os.path.getmtime(path)))
+            except OSError:
+                #removed meanwhile by another SASpy process
+                pass
+        return sorted(out, key=lambda w: w[2])
+
+    def prune(self, maxSize = None, maxAge = None):
+        """Remove failed workspaces above the quota, return their paths"""
+        maxSize = self.maxFailedSize if maxSize is None else maxSize
+        maxAge = self.maxFailedAge if maxAge is None else maxAge
+        kept = self.failed()
+        total = sum(w[1] for w in kept)
+        now = time.time()
+        removed = []
+        for path, size, mtime in kept:
+            if now - mtime <= maxAge and total <= maxSize:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed.append(path)
+        return removed
+
+    def stats(self):
+        with self.lock:
+            return {'idle':len(self.idle),
+                    'created':self.created,
+                    'reused':self.reused}
+
+    def clear(self):
+        #idle workspaces only, the failed ones are kept for inspection
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for path in idle:
+            shutil.rmtree(path, ignore_errors=True)
+        if self.temporary:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+workspacePool = WorkspacePool()
+
+def saspyWorkspaces(action = 'list', maxsize = '', maxage = ''):
+    '''List or prune the workspaces kept from failed runs
+
+    USAGE: saspy_workspaces [list|prune [, maxsize [, maxage]]]
+    maxsize is given in MB and maxage in hours; they set the quota for
+    failed workspaces, which prune applies (prune, 0 removes all).
+    '''
+    if '' != str(maxsize):
+        workspacePool.maxFailedSize = int(float(maxsize) * 1024 * 1024)
+    if '' != str(maxage):
+        workspacePool.maxFailedAge = float(maxage) * 3600
+    if 'prune' == action:
+        removed = workspacePool.prune()
+        message("Removed " + repr(len(removed)) + " failed workspaces")
+    elif 'list' != action:
+        message("ERROR unknown action \'" + action + "\', use list or prune")
+        return
+    failed = workspacePool.failed()
+    st = workspacePool.stats()
+    message("Workspaces: " + workspacePool.rootFolder())
+    message("Failed workspaces: " + workspacePool.failedFolder())
+    message("  idle: " + repr(st['idle']) + ", created: " + repr(st['created'])
+            + ", reused: " + repr(st['reused']))
+    message("  failed: " + repr(len(failed)) + ", %.1f MB of %.1f MB, "
+            "kept for %.0f hours" % (sum(w[1] for w in failed) / 1048576.0,
+                                     workspacePool.maxFailedSize / 1048576.0,
+                                     workspacePool.maxFailedAge / 3600.0))
+    now = time.time()
+    for path, size, mtime in failed:
+        message("  %8.1f MB %6.1f h  %s" % (size / 1048576.0,
+                                            (now - mtime) / 3600.0, path))
+    return failed
+
+cmd.extend("saspy_workspaces", saspyWorkspaces)
+
+class PdbStage:
+    """Session store of PDB files written from PyMOL selections
+
+    Each selection is saved once, under a hash of the selection, its
+    coordinates and the atom properties written to the PDB file, in a
+    directory below scratchRoot(). Further requests for the same
+    selection hardlink the staged file (or copy it, if linking fails)
+    instead of saving it again. Only the current state is staged, the
+    frames of trajectories are saved directly. Least recently used files
+    are evicted above maxSize bytes, a maxSize of 0 disables staging.
+    Staged files are read-only, as they may be shared between several
+    temporary directories; TemporaryDirectory copies them when they are
+    moved out.
+    """
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.folder = None
+        self.files = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, sel, state):
+        h = hashlib.sha1()
+        h.update(("%s\0%d\0" % (sel, state)).encode('utf-8'))
+        coords = cmd.get_coords(sel, state)
+        if hasattr(coords, 'tobytes'):
+            h.update(coords.tobytes())
+        else:
+            h.update(repr(coords).encode('utf-8'))
+        #alter changes these without moving any atom
+        props = []
+        cmd.iterate(sel, 'props.append((type, ID, name, alt, resn, chain, '
+                    'resi, q, b, segi, elem, formal_charge))',
+                    space={'props':props})
+        h.update(repr(props).encode('utf-8'))
+        return h.hexdigest()
+
+    def stageFolder(self):
+        with self.lock:
+            if self.folder is None:
+                self.folder = tempfile.mkdtemp(prefix='saspy_stage',
+                                               dir=scratchRoot())
+                atexit.register(self.clear)
+            return self.folder
+
+    def save(self, sel, state, dst):
+        """Write the PDB file of selection sel in state to dst"""
+        if 0 >= self.maxSize or -1 != state:
+            cmd.save(dst, sel, state=state)
+            return dst
+        key = self.key(sel, state)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        with self.lock:
+            staged = self.files.pop(key, None)
+            if staged is not None:
+                #mark as recently used
+                self.files[key] = staged
+                self.hits += 1
+                linkOrCopy(staged[0], dst)
+                return dst
+            self.misses += 1
+        folder = self.stageFolder()
+        path = os.path.join(folder, key + '.pdb')
+        tmp = os.path.join(folder, '.tmp%s_%d.pdb'
+                           % (key, threading.current_thread().ident))
+        cmd.save(tmp, sel, state=state)
+        if "win32" != platform:
+            os.chmod(tmp, 0o444)
+        with self.lock:
+            if key not in self.files:
+                os.rename(tmp, path)
+                size = os.path.getsize(path)
+                self.files[key] = (path, size)
+                self.size += size
+            linkOrCopy(path, dst)
+            self.evict()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return dst
+
+    def evict(self):
+        #hardlinks in temporary directories keep evicted files alive
+        while self.size > self.maxSize and self.files:
+            key, (path, size) = self.files.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {'files':len(self.files),
+                    'size':self.size,
+                    'maxsize':self.maxSize,
+                    'hits':self.hits,
+                    'misses':self.misses}
+
+    def clear(self):
+        with self.lock:
+            if self.folder is not None:
+                shutil.rmtree(self.folder, ignore_errors=True)
+            self.folder = None
+            self.files.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+pdbStage = PdbStage(256 * 1024 * 1024)
+
+def saspyStage(action = 'stats', maxsize = ''):
+    '''Show statistics of the staged PDB files or clear them
+
+    USAGE: saspy_stage [stats|clear [, maxsize]]
+    maxsize is given in MB, 0 disables staging.
+    '''
+    if '' != str(maxsize):
+        pdbStage.maxSize = int(float(maxsize) * 1024 * 1024)
+        with pdbStage.lock:
+            pdbStage.evict()
+    if 'clear' == action:
+        pdbStage.clear()
+        message("Staged PDB files cleared")
+    elif 'stats' != action:
+        message("ERROR unknown action \'" + action + "\', use stats or clear")
+        return
+    st = pdbStage.stats()
+    message("PDB stage: " + (pdbStage.folder or scratchRoot()))
+    message("  files: " + repr(st['files']) + ", size: %.1f MB of %.1f MB"
+            % (st['size'] / 1048576.0, st['maxsize'] / 1048576.0))
+    message("  hits: " + repr(st['hits']) + ", misses: " + repr(st['misses']))
+    return st
+
+cmd.extend("saspy_stage", saspyStage)
+
+def writePdb(sel, prefix = "", folder = "", state = -1):
+    pdbfn = prefix + sel + ".pdb"
+    npdbfn = pdbfn.replace(" or ", "");
+    npdbfn = npdbfn.replace(" and ", "");
+
+    # Python 2 and 3 string table handling:
+
+    if pythonVersion == 3:
+        try:
+            npdbfn = npdbfn.translate(npdbfn.maketrans('', '', string.whitespace))
+        except ImportError:
+            pass
+    else:
+        try:
+            npdbfn = npdbfn.translate(None, string.whitespace)
+        except ImportError:
+            pass
+    npdbfn = os.path.join(folder, npdbfn)
+    return pdbStage.save(sel, state, npdbfn)
+
+## Output parsers
+#all parsers read each file once, with precompiled patterns anchored at
+#the start of the line, and stop as soon as every field has been found.
+#numbers are taken as whitespace or sign delimited tokens, not from
+#fixed columns, so values that overflow their field are still read.
+
+numberPattern = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+CrysolLog = collections.namedtuple('CrysolLog', 'chi2 Rg eDens')
+SupalmOutput = collections.namedtuple('SupalmOutput', 'nsd matrix')
+SasrefSubunit = collections.namedtuple('SasrefSubunit',
+    'oldX oldY oldZ alpha beta gamma newX newY newZ')
+
+crysolLogPattern = re.compile(
+    r'\s*(?:(?P<fit>Fitting parameters)'
+    r'|Rg from the slope of net intensity[^:]*:\s*(?P<Rg>\S+)'
+    r'|Average electron density[^:]*:\s*(?P<eDens>\S+))')
+supalmRemarkPattern = re.compile(
+    r'REMARK\b(?:(?P<matrix>[^:\n]*Transformation)'
+    r'|[^:\n]*Final distance[^:]*:\s*(?P<nsd>\S+))')
+sasrefRemarkPattern = re.compile(
+    r'REMARK (Old center positioned at|Rotated by Euler angles'
+    r'|New center positioned at)(.*)')
+sasrefRemarkSlots = {'Old center positioned at': 0,
+                     'Rotated by Euler angles': 1,
+                     'New center positioned at': 2}
+sasrefChi2Pattern = re.compile(r'Chi\^?2\s*[=:]\s*([-+]?\d+\.?\d*(?:[eE][-+]?\d+)?)',
+                               re.I)
+
+def toFloat(field, default = 9999):
+    #overflowing Fortran fields are written as '*******'
+    m = numberPattern.match(field)
+    if m is None:
+        return default
+    return float(m.group(0))
+
+def readCrysolLog(logFileName):
+    """Parse a CRYSOL .log file, return a CrysolLog(chi2, Rg, eDens)
+
+    Fields not present in the log are 9999. Does not parse
+    crysol_summary.txt, but the .log file created for each run.
+    """
+    values = {'chi2': 9999, 'Rg': 9999, 'eDens': 9999}
+    pending = set(values)
+    with open(logFileName, 'r') as rf:
+        for line in rf:
+            m = crysolLogPattern.match(line)
+            if m is None:
+                continue
+            if m.group('fit'):
+                #column header, then the row with the fitted values
+                header = next(rf, '').split()
+                row = next(rf, '').split()
+                column = [i for i, h in enumerate(header) if 'chi' in h.lower()]
+                if column and len(header) == len(row):
+                    values['chi2'] = toFloat(row[column[0]])
+                elif row:
+                    values['chi2'] = toFloat(row[-1])
+                pending.discard('chi2')
+            elif m.group('Rg'):
+                values['Rg'] = toFloat(m.group('Rg'))
+                pending.discard('Rg')
+            else:
+                values['eDens'] = toFloat(m.group('eDens'))
+                pending.discard('eDens')
+            if not pending:
+                break
+    return CrysolLog(**values)
+
+def scanPdbRecords(filename, records = (b'REMARK', b'TER'),
+                   until = ()):
+    """Yield the lines of a PDB file that start with one of records
+
+    The file is memory mapped and the records are located with byte
+    searches, so atom lines are never decoded and memory use does not
+    grow with the file. Scanning ends at the first line starting with
+    one of until, e.g. (b'ATOM', b'HETATM') to read the header only.
+    """
+    with open(filename, 'rb') as rf:
+        try:
+            mm = mmap.mmap(rf.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            #empty files can not be mapped
+            return
+        try:
+            def find(tag, pos, end):
+                #offset of the next line starting with tag, -1 if none
+                if 0 == pos and mm[:len(tag)] == tag:
+                    return 0
+                pos = mm.find(b'\n' + tag, pos, end)
+                return -1 if -1 == pos else pos + 1
+
+            end = len(mm)
+            for tag in until:
+                pos = find(tag, 0, end)
+                if -1 != pos:
+                    end = min(end, pos)
+            nxt = dict((tag, find(tag, 0, end)) for tag in records)
+            while True:
+                found = [(pos, tag) for tag, pos in nxt.items() if -1 != pos]
+                if not found:
+                    break
+                start, tag = min(found)
+                stop = mm.find(b'\n', start, end)
+                if -1 == stop:
+                    stop = end
+                yield mm[start:stop].decode('ascii', 'replace').rstrip('\r')
+                nxt[tag] = find(tag, stop, end)
+        finally:
+            mm.close()
+
+def readSupalmPdb(pdbfn):
+    """Parse the REMARKs of a SUPALM or ALPRAXIN output PDB
+
+    Returns a SupalmOutput(nsd, matrix) with the matrix in PyMOL's
+    transform_selection order, or None if the file has no transformation
+    matrix; nsd is 9999 if no final distance is given (e.g. ALPRAXIN).
+    Only the REMARKs before the first atom record are read.
+    """
+    nsd = None
+    matrix = None
+    remarks = scanPdbRecords(pdbfn, (b'REMARK',), (b'ATOM', b'HETATM'))
+    for line in remarks:
+        m = supalmRemarkPattern.match(line)
+        if m is None:
+            continue
+        if m.group('matrix'):
+            #4 rows of 4 values, the first on the remark line itself
+            rows = [numberPattern.findall(line)[-4:]]
+            rows.extend([numberPattern.findall(next(remarks, ''))[-4:]
+                         for i in range(3)])
+            if all(4 == len(row) for row in rows):
+                matrix = [float(rows[j][i]) for i in range(4)
+                          for j in range(4)]
+        else:
+            nsd = toFloat(m.group('nsd'))
+        if nsd is not None and matrix is not None:
+            break
+    remarks.close()
+    return SupalmOutput(9999 if nsd is None else nsd, matrix)
+
+def readSasrefPdb(filename, count = None):
+    """Parse the movement of every subunit from a SASREF output PDB
+
+    Returns one SasrefSubunit (old center, Euler angles, new center)
+    per chain. Only REMARK and TER records are read, and reading stops
+    after count subunits if given.
+    """
+    subunits = []
+    move = [None, None, None]
+    records = scanPdbRecords(filename)
+    for line in records:
+        if line.startswith('TER'):
+            if None not in move:
+                subunits.append(SasrefSubunit(*(move[0] + move[1]
+                                                + move[2])))
+                if count is not None and len(subunits) >= count:
+                    break
+            move = [None, None, None]
+            continue
+        m = sasrefRemarkPattern.match(line)
+        if m:
+            values = [float(v) for v in numberPattern.findall(m.group(2))]
+            if 3 <= len(values):
+                move[sasrefRemarkSlots[m.group(1)]] = values[:3]
+    records.close()
+    return subunits
+
+def parseSasrefChi2(fitfn):
+    '''Parse the final chi2 from the header of a SASREF .fit file'''
+    chi2 = 9999
+    with open(fitfn, 'r') as rf:
+        for line in itertools.islice(rf, 10):
+            m = sasrefChi2Pattern.search(line)
+            if m:
+                chi2 = float(m.group(1))
+                break
+    return chi2
+
+#parse crysol log file
+def parseCrysolLog (logFileName):
+    '''Parse Crysol log file, obtain Chi2, Rg and eDens'''
+    return dict(readCrysolLog(logFileName)._asdict())
+
+def readNSDFromSupalmPdb(pdbfn):
+    """parse NSD value from SUPALM output PDB file
+    useful for Windows users without console access"""
+    return readSupalmPdb(pdbfn).nsd
+
+def readTransformationMatrixFromPdbRemark(pdbfn):
+    #read transformation matrix from output pdb
+    #useful for alpraxin and supalm, None if there is none
+    return readSupalmPdb(pdbfn).matrix
+
+def parseEulerAngles(filename, count = None):
+    '''Parse Euler angles and translations
+    per subunit from SASREF output PDB'''
+    return readSasrefPdb(filename, count)
+
+## CRYSOL result cache
+
+def hashInputs(args, files):
+    '''Hash of an argument vector and the content of the input files'''
+    h = hashlib.sha1()
+    h.update(' '.join(args).encode('utf-8'))
+    for fn in files:
+        h.update(b'\0')
+        with open(fn, 'rb') as rf:
+            for chunk in iter(lambda: rf.read(1 << 20), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+crysolOutputSuffixes = ('00.log', '00.int', '00.fit')
+
+class CrysolCache:
+    """On-disk cache of CRYSOL results, keyed by the content of the inputs
+
+    Each entry is a directory named after a hash of the written PDB file,
+    the CRYSOL argument vector and the SAXS data file. It keeps the output
+    files (by suffix, e.g. '00.log') together with the parsed Rg, chi2 and
+    eDens. Above maxSize bytes, least recently used entries are evicted
+    down to 90% of maxSize; a maxSize of 0 disables the cache. The cache
+    folder is only scanned on the first put and when the running total
+    exceeds maxSize, as it may be on a network file system.
+    """
+
+    def __init__(self, folder, maxSize):
+        self.folder = folder
+        self.maxSize = maxSize
+        self.size = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, args, files):
+        return hashInputs(args, files)
+
+    def get(self, key, fid, folder):
+        """Copy cached outputs into folder, named after fid
+
+        Returns the parsed results, or None if the entry is not cached.
+        """
+        if 0 >= self.maxSize:
+            return None
+        entry = os.path.join(self.folder, key)
+        with self.lock:
+            try:
+                with open(os.path.join(entry, 'result.json'), 'r') as rf:
+                    meta = json.load(rf)
+                for suffix in meta['suffixes']:
+                    shutil.copy(os.path.join(entry, suffix),
+                                os.path.join(folder, fid + suffix))
+                os.utime(entry, None) #mark as recently used
+            except (IOError, OSError, ValueError, KeyError):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return meta['result']
+
+    def put(self, key, fid, folder, result, suffixes = crysolOutputSuffixes):
+        """Store the outputs named after fid in folder under key"""
+        if 0 >= self.maxSize:
+            return
+        entry = os.path.join(self.folder, key)
+        with self.lock:
+            if os.path.isdir(entry):
+                return
+            try:
+                if not os.path.isdir(self.folder):
+                    os.makedirs(self.folder)
+                tmpentry = tempfile.mkdtemp(dir=self.folder, prefix='.tmp')
+                stored = []
+                added = 0
+                for suffix in suffixes:
+                    fn = os.path.join(folder, fid + suffix)
+                    if os.path.isfile(fn):
+                        shutil.copy(fn, os.path.join(tmpentry, suffix))
+                        stored.append(suffix)
+                        added += os.path.getsize(fn)
+                metafn = os.path.join(tmpentry, 'result.json')
+                with open(metafn, 'w') as wf:
+                    json.dump({'suffixes':stored, 'result':result}, wf)
+                added += os.path.getsize(metafn)
+                os.rename(tmpentry, entry)
+            except (IOError, OSError) as e:
+                message("WARNING, could not store CRYSOL results in cache: "
+                        + repr(e))
+                return
+            if self.size is None:
+                self.size = sum(e[1] for e in self.entries())
+            else:
+                self.size += added
+            if self.size > self.maxSize:
+                self.evict()
+
+    def entries(self):
+        """Return (path, size, last use) of all entries, oldest first"""
+        entries = []
+        if not os.path.isdir(self.folder):
+            return entries
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            size = 0
+            for fn in os.listdir(path):
+                size += os.path.getsize(os.path.join(path, fn))
+            entries.append((path, size, os.path.getmtime(path)))
+        entries.sort(key=lambda e: e[2])
+        return entries
+
+    def evict(self):
+        #rescan, other sessions may share the cache
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for path, size, used in entries:
+            if total <= 0.9 * self.maxSize:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        self.size = total
+
+    def stats(self):
+        entries = self.entries()
+        return {'entries':len(entries),
+                'size':sum(e[1] for e in entries),
+                'maxsize':self.maxSize,
+                'hits':self.hits,
+                'misses':self.misses}
+
+    def clear(self):
+        with self.lock:
+            if os.path.isdir(self.folder):
+                shutil.rmtree(self.folder, ignore_errors=True)
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+crysolCache = CrysolCache(os.path.join(os.path.expanduser('~'), '.saspy',
+                                       'crysol_cache'),
+                          500 * 1024 * 1024)
+
+def runCrysol(options, pdbfn, datfn = None, cwd = None, cache = True):
+    '''Run CRYSOL in cwd (default: the current directory), reusing
+    cached results
+
+    Returns the Rg, chi2 and eDens parsed from the CRYSOL log file,
+    and the hash of the inputs as inputHash. With cache False the cache
+    is neither read nor written, e.g. for trajectory frames that are
+    scored once.
+    '''
+    folder = cwd or os.getcwd()
+    fid = os.path.basename(pdbfn).replace(".pdb", "")
+    inputs = [pdbfn]
+    if datfn is not None:
+        inputs.append(datfn)
+    key = crysolCache.key(["crysol"] + options,
+                          [os.path.join(folder, fn) for fn in inputs])
+    result = crysolCache.get(key, fid, folder) if cache else None
+    if result is not None:
+        message("CRYSOL results for \'" + fid + "\' taken from cache")
+        return dict(result, inputHash=key)
+    status = systemCommand(["crysol"] + options + inputs, cwd=cwd)
+    result = parseCrysolLog(os.path.join(folder, fid + "00.log"))
+    if cache and 0 == status:
+        crysolCache.put(key, fid, folder, result)
+    return dict(result, inputHash=key)
+
+def computeAmplitudes(models, folder, workers = 0):
+    '''Compute the CRYSOL amplitudes (.alm) of every model into folder
+
+    The models run concurrently, each in its own temporary directory.
+    Amplitudes are cached by the content of the written PDB file, so
+    unchanged subunits are not recomputed. Returns the .alm file names,
+    relative to folder, None for models that failed.
+    '''
+    def jobs():
+        for m in models:
+            tmpdir = TemporaryDirectory()
+            pdbfn = writePdb(m, folder=tmpdir.temp_dir)
+            yield (tmpdir, os.path.basename(pdbfn))
+
+    def amplitudes(job):
+        tmpdir, pdbfn = job
+        with tmpdir:
+            fid = os.path.splitext(pdbfn)[0]
+            key = crysolCache.key(["crysol", "-p"],
+                                  [os.path.join(tmpdir.temp_dir, pdbfn)])
+            if crysolCache.get(key, fid, tmpdir.temp_dir) is None:
+                status = systemCommand(["crysol", "-p", fid, pdbfn],
+                                       cwd=tmpdir.temp_dir)
+                if 0 == status:
+                    crysolCache.put(key, fid, tmpdir.temp_dir, {}, ('.alm',))
+                message("computed alm for : " + fid)
+            else:
+                message("CRYSOL amplitudes for \'" + fid
+                        + "\' taken from cache")
+            shutil.move(os.path.join(tmpdir.temp_dir, fid + ".alm"),
+                        os.path.join(folder, fid + ".alm"))
+        return fid + ".alm"
+
+    return runParallel(amplitudes, jobs(), workers)
+
+def saspyCache(action = 'stats', maxsize = ''):
+    '''Show statistics of the CRYSOL result cache or clear it
+
+    USAGE: saspy_cache [stats|clear [, maxsize]]
+    maxsize is given in MB, 0 disables the cache.
+    '''
+    if '' != str(maxsize):
+        crysolCache.maxSize = int(float(maxsize) * 1024 * 1024)
+        with crysolCache.lock:
+            crysolCache.evict()
+    if 'clear' == action:
+        crysolCache.clear()
+        message("CRYSOL cache cleared")
+    elif 'stats' != action:
+        message("ERROR unknown action \'" + action + "\', use stats or clear")
+        return
+    st = crysolCache.stats()
+    message("CRYSOL cache: " + crysolCache.folder)
+    message("  entries: " + repr(st['entries']) + ", size: %.1f MB of %.1f MB"
+            % (st['size'] / 1048576.0, st['maxsize'] / 1048576.0))
+    message("  hits: " + repr(st['hits']) + ", misses: " + repr(st['misses']))
+    return st
+
+cmd.extend("saspy_cache", saspyCache)
+
+def simulateScattering(crycalc, models, prefix=defprefix, param = " "):
+    '''Use CRYSOL and ADDERRORS to simulate scattering''' 
+    #write all models into a single file  
+    selection = " or ".join(models)
+    Rg = -9999
+    eDens = -9999
+    df = 'unknown'
+    with TemporaryDirectory() as tmpdir:
+        pdbfn = tmpdir.writePdb(selection)
+        options = ["-ns", "800"] + param.split()
+        if ('yes' == crycalc):
+            message("CRYSOL calculation using explicit hydrogens")
+            options = ["-eh"] + options
+        result = runCrysol(options, pdbfn, cwd=tmpdir.temp_dir)
+        fid = pdbfn.replace(".pdb", "")
+        Rg = result['Rg']
+        eDens = result['eDens']
+        tmpint = fid + "00.int"
+        tmpout = fid + ".dat"
+        tmpdir.run(["adderrors", tmpint, "-o", tmpout])
+        df = tmpdir.move_out_numbered(tmpout, fid, '.dat')
+
+    message("CRYSOL Theoretical Rg = " + repr(Rg))
+    message("CRYSOL Average electron density = " + repr(eDens))
+    message( ".dat file written to " + df)
+    return df
+
+#cmd.extend("simulateScattering", simulateScattering)
+
+#run crysol in predictive mode for a given selection
+def predcrysol(crycalc ,models, prefix=defprefix, param = " "):
+    #write all models into a single file  
+    #crycalc flag for use/non-use of explicit hydrogens
+    selection = " or ".join(models)
+    Rg = -9999
+    eDens = -9999
+    df = 'unknown'
+    with TemporaryDirectory() as tmpdir:
+        pdbfn = tmpdir.writePdb(selection)
+        options = param.split()
+        if ('yes' == crycalc):
+            message("CRYSOL calculation using explicit hydrogens")
+            options = ["-eh"] + options
+        result = runCrysol(options, pdbfn, cwd=tmpdir.temp_dir)
+        fid = pdbfn.replace(".pdb", "")
+        Rg = result['Rg']
+        eDens = result['eDens']
+        df = tmpdir.move_out_numbered(fid+"00.int", fid, '.int')
+        recordResult('predcrysol', selection, inputHash=result['inputHash'],
+                     parameters={'crycalc':crycalc, 'param':param},
+                     Rg=Rg, eDens=eDens, output=df)
+
+    message("CRYSOL Theoretical Rg = " + repr(Rg))
+    message("CRYSOL Average electron density = " + repr(eDens))
+    message( ".int file written to " + df)
+    return df
+
+cmd.extend("predcrysol", predcrysol)
+
+def checkAtsasVersion():
+    '''Check if ATSAS is installed'''
+
+    CHECK_PATH = str(os.getenv('PATH'))
+    if 'ATSAS' in CHECK_PATH:
+        return "OK"
+    else:
+        return "NOBIN"
+    return
+
+cmd.extend("checkAtsasVersion", checkAtsasVersion)
+ 
+#run crysol in fit mode
+def fitcrysol(crycalc, SaxsDataFileName, models, prefix = defprefix, param = ""):
+    if False == os.path.isfile(SaxsDataFileName):
+        message("SAXS .dat file \'"+SaxsDataFileName+"\' not found")
+        return
+    fileFullPath = os.path.abspath(SaxsDataFileName);
+
+    Rg = -9999
+    chi2 = -9999
+    eDens = -9999
+    
+    #write all models into a single file  
+    selection = " or ".join(models)
+    with TemporaryDirectory() as tmpdir:
+        pdbfn = tmpdir.writePdb(selection)
+        options = param.split()
+        if ('yes' == crycalc):
+            message("CRYSOL calculation using explicit hydrogens")
+            options = ["-eh"] + options
+        result = runCrysol(options, pdbfn, fileFullPath,
+                           cwd=tmpdir.temp_dir)
+        fid = pdbfn.replace(".pdb", "")
+        logfile = fid+"00.log"
+        Rg = result['Rg']
+        chi2 = result['chi2']
+        eDens = result['eDens']
+        df = tmpdir.move_out_numbered(fid+"00.fit", fid, '.fit')
+        logfn = tmpdir.move_out_numbered(logfile, fid, '.log')
+        recordResult('fitcrysol', selection, fileFullPath,
+                     result['inputHash'],
+                     {'crycalc':crycalc, 'param':param},
+                     chi2, Rg, eDens, output=df)
+
+        message( ".log file written to " + logfn)
+        message( ".fit file written to " + df)
+        #if there is more than one model, we are evaluating a complex
+        #in this case we should provide the coordinates of the complex
+        #to the user.
+        if 1 < len(models):
+            pdbfn=tmpdir.move_out_numbered(pdbfn, fid, '.pdb')
+            message( ".pdb file written to " + pdbfn)
+         
+    message("CRYSOL Theoretical Rg = " + repr(Rg))
+    message("CRYSOL Chi-square = " + repr(chi2))
+    message("CRYSOL Average electron density = " + repr(eDens))
+    return df
+
+cmd.extend("fitcrysol", fitcrysol)
+
+#run crysol in fit mode for each model separately
+def batchcrysol(crycalc, SaxsDataFileName, models = [], prefix = defprefix,
+                param = "", workers = 0):
+    '''Fit every model separately against one SAXS .dat file
+
+    The CRYSOL runs are executed concurrently, at most workers at a time
+    (one per core by default). Returns the results ranked by chi2.
+    USAGE: batchcrysol no, data.dat [, model1 model2 ...]
+    '''
+    if False == os.path.isfile(SaxsDataFileName):
+        message("SAXS .dat file \'"+SaxsDataFileName+"\' not found")
+        return
+    fileFullPath = os.path.abspath(SaxsDataFileName)
+    models = selectionList(models)
+    options = param.split()
+    if ('yes' == crycalc):
+        message("CRYSOL calculation using explicit hydrogens")
+        options = ["-eh"] + options
+
+    def jobs():
+        #models are written one at a time, as the pool picks them up
+        for m in models:
+            tmpdir = TemporaryDirectory()
+            pdbfn = writePdb(m, folder=tmpdir.temp_dir)
+            yield (m, tmpdir, os.path.basename(pdbfn))
+
+    def fit(job):
+        m, tmpdir, pdbfn = job
+        with tmpdir:
+            result = runCrysol(options, pdbfn, fileFullPath,
+                               cwd=tmpdir.temp_dir)
+            fid = pdbfn.replace(".pdb", "")
+            result['model'] = m
+            result['fit'] = tmpdir.move_out_numbered(fid+"00.fit", fid, '.fit')
+        recordResult('batchcrysol', m, fileFullPath, result['inputHash'],
+                     {'crycalc':crycalc, 'param':param}, result['chi2'],
+                     result['Rg'], result['eDens'], output=result['fit'])
+        return result
+
+    results = runParallel(fit, jobs(), workers)
+    ranked = sorted([r for r in results if r is not None],
+                    key=lambda r: r['chi2'])
+
+    table = "%4s  %-20s %10s %10s %10s  %s\n" % (
+            "Rank", "Model", "Chi2", "Rg", "eDens", "Fit")
+    for rank, r in enumerate(ranked):
+        table += "%4d  %-20s %10.3f %10.3f %10.3f  %s\n" % (
+            rank + 1, r['model'], r['chi2'], r['Rg'], r['eDens'], r['fit'])
+    sys.stdout.write(table)
+    tablefn = destFile(os.getcwd(), prefix + "_batchcrysol", ".txt")
+    with open(tablefn, 'w') as wf:
+        wf.write(table)
+    message("CRYSOL fitted " + getPlural(len(ranked)) + " out of "
+            + repr(len(models)) + ", table written to " + tablefn)
+    return ranked
+
+cmd.extend("batchcrysol", batchcrysol)
+
+#run crysol for every state of a multi-state object
+def trajcrysol(obj, SaxsDataFileName = "", crycalc = 'no', prefix = defprefix,
+               param = "", workers = 0, backlog = 0, first = 1, last = 0):
+    '''Score every state of a multi-state object (e.g. an MD trajectory)
+
+    States are written one at a time and streamed to a pool of CRYSOL
+    workers, never more than backlog frames ahead of them, and each
+    frame is removed once it has been scored; frames are not stored in
+    the CRYSOL cache. With a SAXS .dat file the
+    states are fitted, otherwise only Rg and eDens are predicted.
+    Returns the per-state series, which is also written to a text file.
+    USAGE: trajcrysol object [, data.dat [, no|yes]]
+    '''
+    fileFullPath = None
+    if "" != SaxsDataFileName:
+        if False == os.path.isfile(SaxsDataFileName):
+            message("SAXS .dat file \'"+SaxsDataFileName+"\' not found")
+            return
+        fileFullPath = os.path.abspath(SaxsDataFileName)
+    first = int(first)
+    last = int(last)
+    if 1 > last:
+        last = cmd.count_states(obj)
+    options = param.split()
+    if ('yes' == crycalc):
+        message("CRYSOL calculation using explicit hydrogens")
+        options = ["-eh"] + options
+    message("CRYSOL will score states " + repr(first) + " to " + repr(last)
+            + " of \'" + obj + "\'")
+
+    def frames():
+        for state in range(first, last + 1):
+            tmpdir = TemporaryDirectory()
+            pdbfn = writePdb(obj, folder=tmpdir.temp_dir, state=state)
+            yield (state, tmpdir, os.path.basename(pdbfn))
+
+    def score(frame):
+        state, tmpdir, pdbfn = frame
+        with tmpdir:
+            result = runCrysol(options, pdbfn, fileFullPath,
+                               cwd=tmpdir.temp_dir, cache=False)
+        result['state'] = state
+        recordResult('trajcrysol', "%s:%d" % (obj, state), fileFullPath,
+                     result['inputHash'], {'crycalc':crycalc, 'param':param},
+                     result['chi2'] if fileFullPath else None, result['Rg'],
+                     result['eDens'])
+        return result
+
+    results = runParallel(score, frames(), workers, backlog)
+    series = [r for r in results if r is not None]
+
+    header = "%6s %10s %10s %10s\n" % ("State", "Chi2", "Rg", "eDens")
+    seriesfn = destFile(os.getcwd(), prefix + "_" + obj + "_traj", ".txt")
+    with open(seriesfn, 'w') as wf:
+        wf.write(header)
+        for r in series:
+            wf.write("%6d %10.3f %10.3f %10.3f\n" % (
+                     r['state'], r['chi2'], r['Rg'], r['eDens']))
+    message("CRYSOL scored " + repr(len(series)) + " out of "
+            + repr(last - first + 1) + " states, series written to "
+            + seriesfn)
+    if fileFullPath is not None and 0 < len(series):
+        best = min(series, key=lambda r: r['chi2'])
+        message("Best state: " + repr(best['state'])
+                + ", CRYSOL Chi-square = " + repr(best['chi2']))
+    return series
+
+cmd.extend("trajcrysol", trajcrysol)
+
+#run sreflex
+class SreflexRun:
+    """One SREFLEX run on one dataset
+
+    Holds the output folder and the models and fits loaded so far. The
+    rc01 and uc01 models are loaded as soon as their .pdb and .fit files
+    are complete, i.e. did not grow since the previous scan, and once
+    more from report.txt when SREFLEX has finished. SREFLEX refuses to
+    write into an existing folder, so it gets the subfolder 'sreflex' of
+    the folder claimed with destFile, which stays claimed.
+    """
+
+    def __init__(self, dataset, claimed, runId, models):
+        self.dataset = dataset
+        self.folder = os.path.join(claimed, 'sreflex')
+        self.runId = runId
+        self.inputs = list(models)
+        self.models = []
+        self.fits = []
+        self.status = None
+        self.report = False
+        self.inputHash = None
+        self.sizes = {}
+        self.lock = threading.Lock()
+
+    def files(self, modelid):
+        return (os.path.join(self.folder, "models", modelid + ".pdb"),
+                os.path.join(self.folder, "fits", modelid + ".fit"))
+
+    def reportEntries(self):
+        reportfn = os.path.join(self.folder, "report.txt")
+        if not os.path.isfile(reportfn):
+            return None
+        entries = []
+        with open(reportfn, 'r') as rf:
+            for line in rf:
+                sys.stdout.write(line)
+                words = line.split()
+                if words and words[0].startswith(('rc01', 'uc01')):
+                    entries.append(words[0])
+        return entries
+
+    def scan(self, final = False):
+        """Load the models that are complete, return how many are new"""
+        if final:
+            ids = self.reportEntries()
+            self.report = ids is not None
+            ids = ids or []
+        else:
+            try:
+                ids = sorted(fn[:-4] for fn in
+                             os.listdir(os.path.join(self.folder, "models"))
+                             if fn.startswith(('rc01', 'uc01'))
+                             and fn.endswith('.pdb'))
+            except OSError:
+                #SREFLEX has not created the folder yet
+                return 0
+        new = 0
+        for modelid in ids:
+            with self.lock:
+                if modelid in self.sizes and self.sizes[modelid] is None:
+                    continue
+                try:
+                    sizes = tuple(os.path.getsize(fn)
+                                  for fn in self.files(modelid))
+                except OSError:
+                    continue
+                if not final and (0 in sizes
+                                  or sizes != self.sizes.get(modelid)):
+                    #still being written, check again next time
+                    self.sizes[modelid] = sizes
+                    continue
+                self.sizes[modelid] = None
+            self.load(modelid)
+            new += 1
+        return new
+
+    def load(self, modelid):
+        pdbfn, fitfn = self.files(modelid)
+        name = "sreflex" + repr(self.runId) + modelid
+        mainLoop.call(cmd.load, pdbfn, name)
+        with self.lock:
+            self.models.append(name)
+            self.fits.append(fitfn)
+        message("SREFLEX model \'" + name + "\' loaded")
+        recordResult('sreflex', name, self.dataset, self.inputHash,
+                     parameters={'models':self.inputs}, output=fitfn)
+
+    def asDict(self):
+        with self.lock:
+            return {'folder':self.folder, 'dataset':self.dataset,
+                    'models':list(self.models), 'fits':list(self.fits),
+                    'status':self.status}
+
+def runSreflex(run, pdbs, folder, interval = 2.0):
+    '''Run SREFLEX in folder on the PDB files pdbs of run.inputs
+
+    The output folder is scanned every interval seconds while SREFLEX
+    runs, so that models are loaded as they appear.
+    '''
+    job = currentJob()
+    stop = threading.Event()
+    run.inputHash = hashInputs(["sreflex"], [run.dataset]
+                               + [os.path.join(folder, fn) for fn in pdbs])
+
+    def watch():
+        jobContext.job = job
+        while not stop.wait(interval):
+            try:
+                run.scan()
+            except Exception as e:
+                message("ERROR while reading SREFLEX output: " + repr(e))
+
+    watcher = threading.Thread(target = watch, name = 'saspy_sreflex')
+    watcher.daemon = True
+    watcher.start()
+    try:
+        run.status = systemCommand(["sreflex", "-p", run.folder, run.dataset,
+                                    ",".join(pdbs)], cwd=folder)
+    finally:
+        stop.set()
+        watcher.join()
+    message("sreflex finished.")
+    run.scan(final=True)
+    if not run.report:
+        message("SREFLEX report file \'"
+                + os.path.join(run.folder, "report.txt")
+                + "\' not found, something went wrong")
+    return run
+
+def sreflex(SaxsDataFileName, models,
+            viewer='primus', prefix=defprefix, outdir=''):
+    if False == os.path.isfile(SaxsDataFileName):
+        message("SAXS .dat file \'"+SaxsDataFileName+"\' not found")
+        return 113
+    fileFullPath = os.path.abspath(SaxsDataFileName);
+    models = selectionList(models)
+    with TemporaryDirectory() as tmpdir:
+        pdbs = [tmpdir.writePdb(m) for m in models]
+        df = destFile(outdir or os.getcwd(), prefix+"_sreflex", "",
+                      directory=True)
+        run = SreflexRun(fileFullPath, df, session.nextRun(), models)
+        runSreflex(run, pdbs, tmpdir.temp_dir)
+    if not run.report:
+        return 116
+    session.setCurves(run.fits)
+    mainLoop.call(openDatFile, viewer, list(run.fits))
+    return run.asDict()
+
+cmd.extend("sreflex", sreflex)
+
+def multisreflex(datasets, models, viewer = 'primus', prefix = defprefix,
+                 workers = 0):
+    '''Run SREFLEX for several SAXS .dat files concurrently
+
+    One SREFLEX process per dataset, at most workers at a time. The
+    models of every run are loaded as they appear, and its fits are
+    opened in the viewer when the run has finished. Returns one dict
+    per run (folder, dataset, models, fits, status).
+    USAGE: multisreflex data1.dat data2.dat ..., model1 model2 ...
+    '''
+    datasets = selectionList(datasets)
+    missing = [fn for fn in datasets if not os.path.isfile(fn)]
+    if missing or 0 == len(datasets):
+        message("SAXS .dat files not found: " + repr(missing or datasets))
+        return
+    models = selectionList(models)
+    with TemporaryDirectory() as tmpdir:
+        pdbs = [tmpdir.writePdb(m) for m in models]
+        runs = []
+        for fn in datasets:
+            name = os.path.splitext(os.path.basename(fn))[0]
+            df = destFile(os.getcwd(), prefix + "_" + name + "_sreflex", "",
+                          directory=True)
+            runs.append(SreflexRun(os.path.abspath(fn), df,
+                                   session.nextRun(), models))
+
+        def one(run):
+            #each run in its own folder, SREFLEX writes scratch files
+            folder = tempfile.mkdtemp('sreflex', dir=tmpdir.temp_dir)
+            for pdbfn in pdbs:
+                linkOrCopy(os.path.join(tmpdir.temp_dir, pdbfn),
+                           os.path.join(folder, pdbfn))
+            runSreflex(run, pdbs, folder)
+            if run.fits:
+                mainLoop.call(openDatFile, viewer, list(run.fits))
+            return run
+
+        runParallel(one, runs, workers)
+    for run in runs:
+        message("SREFLEX " + os.path.basename(run.dataset) + ": "
+                + getPlural(len(run.models)) + " loaded from " + run.folder)
+    return [run.asDict() for run in runs]
+
+cmd.extend("multisreflex", multisreflex)
+
+def alpraxin(models, enantiomode):
+    """run alpraxin and apply transformation matrix"""
+    sel = " or ".join(models)
+        
+    with TemporaryDirectory() as tmpdir:
+        pdbfn = tmpdir.writePdb(sel, "in_")
+        outfn = sel + ".pdb"
+        outfn = outfn.replace(" ", "")
+        aargs = ["alpraxin", pdbfn]
+        if ('yes' == enantiomode):
+            message("ALPRAXIN will create enantiomer as new model")
+            aargs.append("--enantiomorph=Y")
+        aargs.append("-o")
+        aargs.append(outfn)
+        tmpdir.run(aargs)
+        if ('no' == enantiomode):
+            tmat = readTransformationMatrixFromPdbRemark(tmpdir.path(outfn))
+            if tmat is None:
+                message("ERROR no transformation matrix in ALPRAXIN output")
+                return
+            mainLoop.call(cmd.transform_selection, sel, tmat)
+        if('yes' == enantiomode):
+            #the output is removed with the temporary directory
+            mainLoop.callAndWait(cmd.load, tmpdir.path(outfn),
+                                 "enantiomorph_"+sel)
+
+cmd.extend("alpraxin", alpraxin)
+
+def supalm(template, toalign):
+    """run supalm and apply transformation matrix, return the NSD"""
+    if(toalign == template):
+        message("ERROR Please choose different models for superimposition\n")
+        return
+    with TemporaryDirectory('supalm') as tmpdir:
+        folder = tmpdir.temp_dir
+        f1 = os.path.basename(writePdb(template, folder=folder))
+        f2 = os.path.basename(writePdb(toalign, "in_", folder))
+        outfn = toalign + ".pdb"
+        sargs = ['supalm', '-o', outfn]
+        sargs.append('--prog2=crysol')
+        sargs.append('--enantiomorphs=N')
+        sargs.append(f1)
+        sargs.append(f2)
+        systemCommand(sargs, cwd=folder)
+        outpath = os.path.join(folder, outfn)
+        if not os.path.isfile(outpath):
+            message("ERROR SUPALM did not write \'" + outfn + "\'")
+            return 116
+        nsd, tmat = readSupalmPdb(outpath)
+        if tmat is None:
+            message("ERROR no transformation matrix in SUPALM output")
+            return 116
+        mainLoop.call(cmd.transform_selection, toalign, tmat)
+        message("SUPALM NSD = " + repr(nsd))
+        recordResult('supalm', toalign,
+                     inputHash=hashInputs(sargs, [os.path.join(folder, f)
+                                                  for f in (f1, f2)]),
+                     parameters={'template':template}, nsd=nsd)
+    return nsd
+cmd.extend("supalm", supalm)
+
+def batchsupalm(template, models = [], workers = 0, prefix = defprefix):
+    '''Superimpose many models onto one template with SUPALM
+
+    The template is written once and linked into the folder of every
+    run; the SUPALM runs are executed concurrently, at most workers at a
+    time (one per core by default). Each model is moved by its
+    transformation matrix. Returns (model, NSD) ranked by NSD.
+    USAGE: batchsupalm template [, model1 model2 ...]
+    '''
+    models = [m for m in selectionList(models) if m != template]
+    if 0 == len(models):
+        message("ERROR Please choose models to superimpose onto \'"
+                + template + "\'")
+        return
+    with TemporaryDirectory('supalm') as tmpdir:
+        tfn = tmpdir.writePdb(template)
+        templateHash = hashInputs([], [os.path.join(tmpdir.temp_dir, tfn)])
+
+        def jobs():
+            #models are written one at a time, as the pool picks them up
+            for m in models:
+                folder = tempfile.mkdtemp(m, dir=tmpdir.temp_dir)
+                linkOrCopy(os.path.join(tmpdir.temp_dir, tfn),
+                           os.path.join(folder, tfn))
+                pdbfn = writePdb(m, "in_", folder)
+                yield (m, folder, os.path.basename(pdbfn))
+
+        def align(job):
+            m, folder, pdbfn = job
+            outfn = m + ".pdb"
+            sargs = ['supalm', '-o', outfn, '--prog2=crysol',
+                     '--enantiomorphs=N', tfn, pdbfn]
+            systemCommand(sargs, cwd=folder)
+            #NSD and matrix in one pass, see readNSDFromSupalmPdb and
+            #readTransformationMatrixFromPdbRemark
+            nsd, tmat = readSupalmPdb(os.path.join(folder, outfn))
+            if tmat is None:
+                message("ERROR no transformation matrix in SUPALM output of \'"
+                        + m + "\'")
+                return None
+            mainLoop.call(cmd.transform_selection, m, tmat)
+            recordResult('supalm', m,
+                         inputHash=hashInputs(sargs + [templateHash],
+                                              [os.path.join(folder, pdbfn)]),
+                         parameters={'template':template}, nsd=nsd)
+            return nsd
+
+        nsds = runParallel(align, jobs(), workers)
+    ranked = sorted([(m, nsd) for m, nsd in zip(models, nsds)
+                     if nsd is not None], key=lambda r: r[1])
+
+    table = "%4s  %-20s %10s\n" % ("Rank", "Model", "NSD")
+    for rank, (m, nsd) in enumerate(ranked):
+        table += "%4d  %-20s %10.3f\n" % (rank + 1, m, nsd)
+    sys.stdout.write(table)
+    tablefn = destFile(os.getcwd(), prefix + "_batchsupalm", ".txt")
+    with open(tablefn, 'w') as wf:
+        wf.write("#template: " + template + "\n")
+        wf.write(table)
+    message("SUPALM superimposed " + getPlural(len(ranked)) + " out of "
+            + repr(len(models)) + " onto \'" + template
+            + "\', table written to " + tablefn)
+    return ranked
+
+cmd.extend("batchsupalm", batchsupalm)
+
+def openSingleDatFile(viewer, fn):
+    openDatFile(viewer, [fn])
+
+def openDatFile(viewer, fnlst = []):
+    #message(repr(fnlst))
+    if not viewer:
+        #no viewer, e.g. in batch runs
+        return
+    for fn in fnlst:
+        if not os.path.isfile(fn):
+            message("ERROR Curve file \'" + fn + "\' not found.")
+    if('darwin' == platform):
+            # As of High Sierra OSX the "open -a" call is not needed
+            # Leaving this if/else statement in case needed later
+#        viewerproc = subprocess.Popen(["open"] + ["-a"] + [viewer] + fnlst)       
+        viewerproc = subprocess.Popen([viewer] + fnlst) 
+    else:
+        viewerproc = subprocess.Popen([viewer] + fnlst) 
+ 
+def damdisplay(sel, color='white', transparency=0.5):
+    '''set visualization of dummy atom models'''
+    #cmd.hide(representation="nonbonded", selection = sel);
+    cmd.hide(representation="everything", selection = sel);
+    cmd.color(color, selection = sel);
+    cmd.set("transparency", transparency, selection = sel);
+    cmd.show(representation="surface", selection = sel);
+
+cmd.extend("damdisplay", damdisplay);
+
+def updateCurrentDat(newDatFile):
+    session.setCurves([newDatFile])
+
+def extractCoords(objects, selection, state = -1):
+    #coordinates of selection in every object, None if it has no atoms
+    coords = []
+    for obj in objects:
+        xyz = cmd.get_coords("(" + obj + ") and (" + selection + ")", state)
+        coords.append(None if xyz is None or 0 == len(xyz)
+                      else transforms.numpy.asarray(xyz, dtype=float))
+    return coords
+
+def atomIdentities(objects, selection):
+    #(chain, resi, resn, name) of the atoms of selection in every object
+    identities = []
+    for obj in objects:
+        atoms = []
+        cmd.iterate("(" + obj + ") and (" + selection + ")",
+                    'atoms.append((chain, resi, resn, name))',
+                    space={'atoms':atoms})
+        identities.append(atoms)
+    return identities
+
+def applyPoses(objects, ttts):
+    #every state of each object is moved, as cmd.align does
+    counts = [cmd.count_states(obj) for obj in objects]
+    for state in range(1, max(counts + [0]) + 1):
+        idx = [i for i, n in enumerate(counts) if n >= state]
+        transforms.loadTransformed([objects[i] for i in idx], ttts[idx],
+                                   state)
+
+def alignOne(mobile, target):
+    #(rmsd, aligned atoms) of cmd.align, None if the alignment failed
+    try:
+        result = cmd.align(mobile, target)
+    except Exception as e:
+        message("ERROR aligning \'" + mobile + "\': " + repr(e))
+        return None
+    return result[0], result[1]
+
+def alignToReference(ref, objects = [], method = 'auto',
+                     selection = 'name CA', workers = 0):
+    '''Superimpose objects (default: all) onto ref
+
+    Methods:
+    fit -- least-squares superposition of the atoms in selection, matched
+           by their order (e.g. SREFLEX models of one structure); all
+           objects are fitted at once with NumPy and moved in one update
+    align -- cmd.align, with a sequence alignment
+    supalm -- SUPALM, for dummy atom models, runs in a pool of workers
+    auto -- fit where chain, residue number, residue name and atom name
+            match ref atom by atom, align otherwise
+    Returns rows (model, score, atoms, method) sorted by the score, the
+    RMSD (or the NSD for supalm); failed alignments have score None.
+    '''
+    objects = [obj for obj in selectionList(objects) if obj != ref]
+    if method not in ('auto', 'fit', 'align', 'supalm'):
+        message("ERROR unknown method \'" + method
+                + "\', use auto, fit, align or supalm")
+        return
+    if method in ('auto', 'fit') and transforms.numpy is None:
+        message("NumPy not available, using cmd.align")
+        method = 'align'
+    rows = []
+    rest = list(objects)
+    if method in ('auto', 'fit'):
+        coords = mainLoop.callAndWait(extractCoords, [ref] + objects,
+                                      selection)
+        target = coords[0]
+        fit = [i for i, xyz in enumerate(coords[1:])
+               if target is not None and xyz is not None
+               and 3 <= len(target) and len(xyz) == len(target)]
+        if 'auto' == method and fit:
+            #equal counts alone do not make the same structure
+            ids = mainLoop.callAndWait(atomIdentities,
+                                       [ref] + [objects[i] for i in fit],
+                                       selection)
+            fit = [i for i, atoms in zip(fit, ids[1:]) if atoms == ids[0]]
+        if fit:
+            #the superposition runs here, in the calling job
+            ttts, rmsd = transforms.superpose([coords[i + 1] for i in fit],
+                                              target)
+            fitted = [objects[i] for i in fit]
+            mainLoop.call(applyPoses, fitted, ttts)
+            rows.extend([(obj, float(r), len(target), 'fit')
+                         for obj, r in zip(fitted, rmsd)])
+        fit = set(fit)
+        rest = [obj for i, obj in enumerate(objects) if i not in fit]
+        if 'fit' == method:
+            rows.extend([(obj, None, 0, 'fit') for obj in rest])
+            rest = []
+    if 'supalm' == method:
+        nsds = dict(batchsupalm(ref, rest, workers) or [])
+        rows.extend([(obj, nsds.get(obj), 0, 'supalm') for obj in rest])
+    else:
+        for obj in rest:
+            result = mainLoop.callAndWait(alignOne, obj, ref)
+            rows.append((obj, None, 0, 'align') if result is None
+                        else (obj, result[0], result[1], 'align'))
+    rows.sort(key=lambda r: (r[1] is None, r[1]))
+    message("Superposition onto \'" + ref + "\':")
+    message("%-24s %10s %8s  %s" % ("Model", "RMSD/NSD", "Atoms", "Method"))
+    for obj, score, atoms, how in rows:
+        message("%-24s %10s %8s  %s" % (obj, "-" if score is None
+                                        else "%.3f" % score, atoms or "-",
+                                        how))
+    return rows
+
+def allToRefAlign(ref, method = 'auto', selection = 'name CA',
+                  workers = 0):
+    '''Superimpose all objects onto ref and list them sorted by RMSD
+
+    USAGE: allToRefAlign ref [, auto|fit|align|supalm [, selection
+           [, workers]]]
+    See alignToReference for the methods. Called from the GUI thread,
+    the alignment runs as a job and its table is printed when done.
+    '''
+    args = (ref, [], method, selection, workers)
+    if mainLoop.widget is not None \
+            and threading.current_thread() is mainLoop.mainThread:
+        return jobEngine.submit('align', alignToReference, args)
+    return alignToReference(*args)
+
+cmd.extend("allToRefAlign", allToRefAlign);
+
+def anglesToTTTMat(movement):
+    '''Return a PyMOL transformation matrix from a set of 
+    SASREF translation vectors and Euler angles'''
+    alpha = math.radians(movement[3])
+    beta  = math.radians(movement[4])
+    gamma = math.radians(movement[5])
+    
+    sinalp = - math.sin(alpha)
+    cosalp =   math.cos(alpha)
+    sinbet = - math.sin(beta)
+    cosbet =   math.cos(beta)
+    singam = - math.sin(gamma)
+    cosgam =   math.cos(gamma)
+
+    #transforming to PyMOL TTT as explained in
+    #http://www.pymolwiki.org/index.php/Transform_selection
+
+    output = []
+    output.append(cosalp*cosbet*cosgam - sinalp*singam)
+    output.append(-cosalp*cosbet*singam - sinalp*cosgam)
+    output.append(cosalp*sinbet)
+    output.append(movement[6])
+    output.append(sinalp*cosbet*cosgam + cosalp*singam)
+    output.append(-sinalp*cosbet*singam + cosalp*cosgam)
+    output.append(sinalp*sinbet)
+    output.append(movement[7])
+    output.append(-sinbet*cosgam)
+    output.append(sinbet*singam)
+    output.append(cosbet)
+    output.append(movement[8])
+    output.append(-movement[0])
+    output.append(-movement[1])
+    output.append(-movement[2])
+    output.append(1.0)
+    return output
+
+def applySubunitMoves(models, moves, state = -1):
+    '''Move every model by its SASREF move (readSasrefPdb)
+
+    With NumPy all models are moved in one batched coordinate update,
+    otherwise one transform_selection per model. Runs in the main thread.
+    '''
+    models = models[:len(moves)]
+    if 0 == len(models):
+        return
+    if transforms.numpy is None:
+        for model, mov in zip(models, moves):
+            mainLoop.call(cmd.transform_selection, model,
+                          anglesToTTTMat(mov), state=state)
+        return
+    mainLoop.call(transforms.loadTransformed, models,
+                  transforms.movesToTTT(moves), state)
+
+def sasrefCommandFile(prefix, saxsfn, alms, confp, seed = ""):
+    '''Return the SASREF expert mode input for the given subunit amplitudes'''
+    sc = ""
+    sc += "Expert  ! Configuration mode\n"
+    sc += prefix + " ! logfilename\n"
+    sc += prefix + " ! projectDescription\n"
+    sc += "%-8s! initRandomSeed\n" % seed
+    sc += repr(len(alms)) + "     ! totalNumberOfSubunits\n"
+    sc += "P1      ! Symmetry\n"
+    sc += "1       ! totalNumberOfScatteringCurves\n"
+    sc += "N       ! KratkyGeometry\n"
+    sc += "1,2     ! Input first & last subunits in 1-st construct\n"
+    sc += saxsfn+ " ! Enter file name, 1-st experimental data\n"
+    sc += "        ! Angular units input file\n"
+    sc += "1.0     ! Fitting range in fractions of Smax\n"
+
+    count = 1
+    for alm in alms:
+        sc += alm+"! subunit " +repr(count)+" amplitudes\n"
+        sc += "0.0     ! Initial rotation by alpha\n"
+        sc += "0.0     ! Initial rotation by beta\n"
+        sc += "0.0     ! Initial rotation by gamma\n"
+        sc += confp['shft']+"       ! Initial shift along X\n"
+        sc += confp['shft']+"       ! Initial shift along Y\n"
+        sc += confp['shft']+"       ! Initial shift along Z\n"
+        sc += "N       ! Movements limitations of subunit:  N/F/X/Y/Z/D\n"
+        sc += confp['spst'] + " ! Spatial step in Angstrom\n"
+        sc += confp['anst'] + " ! Angular step in degrees\n"
+
+
+    #continue with rest of commands
+    sc += "        ! Cross penalty weight\n"
+    sc += "        ! Disconnectivity penalty weight\n"
+    sc += "        ! Docking penalty weight\n"
+    sc += "        ! File name, contacts conditions, CR for none\n"
+    sc += "U       ! Expected particle shape: <P>rolate, <O>blate or <U>nknown\n"
+    sc += "        ! Shift penalty weight \n"
+    sc += confp['init'] + "     ! Initial annealing temperature (def= 10)   \n"
+    sc += confp['sche'] + "     ! Annealing schedule factor\n"
+    sc += confp['iter'] +  "    ! Max # of iterations at each T (def = 10000)\n"
+    sc += confp['maxs'] + "     ! Max # of successes at each T (def = 1000)\n"
+    sc += confp['mins'] +"      ! Min # of successes to continue (def = 100)\n"
+    sc += confp['maxa'] +"      ! Max # of annealing steps (def = 100)\n"
+    sc += confp['msol']+"       ! Max # of solutions to store (def = 1)\n"
+    return sc
+
+def runSasref(folder, comfn):
+    #SASREF reads its configuration from stdin
+    if "win32" != platform:
+        with open(os.path.join(folder, comfn), 'r') as commandfile:
+            return systemCommand(['sasref'], stdin=commandfile, cwd=folder)
+    #somehow this doesn't work on Windows with PyMOL 2.0
+    #there's an issue with the underlying libraries...
+    #so the redirection is left to the shell
+    return systemCommand('sasref < ' + comfn, shell=True, cwd=folder)
+
+def linkOrCopy(src, dst):
+    #share a read-only input between directories without copying it
+    try:
+        os.link(src, dst)
+    except (OSError, AttributeError):
+        shutil.copy(src, dst)
+
+def sasrefMultiStart(prefix, folder, saxsfn, alms, confp, starts,
+                     workers = 0):
+    '''Run SASREF from several random seeds concurrently
+
+    Each run works in its own temporary directory on links to the data
+    and amplitudes in folder. The .pdb and .fit of the run with the
+    lowest chi2 are moved to folder. Returns (seed, chi2) of all
+    successful runs, best first.
+    '''
+    rng = random.SystemRandom()
+    runs = [(rng.randint(1, 999999), TemporaryDirectory())
+            for i in range(starts)]
+
+    def run(job):
+        seed, rundir = job
+        for fn in [saxsfn] + alms:
+            linkOrCopy(os.path.join(folder, fn),
+                       os.path.join(rundir.temp_dir, fn))
+        comfn = 'setup_sasref.com'
+        with open(os.path.join(rundir.temp_dir, comfn), 'w') as commandfile:
+            commandfile.write(sasrefCommandFile(prefix, saxsfn, alms, confp,
+                                                repr(seed)))
+        runSasref(rundir.temp_dir, comfn)
+        return parseSasrefChi2(os.path.join(rundir.temp_dir,
+                                            prefix + "-1.fit"))
+
+    try:
+        chi2s = runParallel(run, runs, workers)
+        results = sorted([(seed, chi2) for (seed, rundir), chi2
+                          in zip(runs, chi2s) if chi2 is not None],
+                         key=lambda r: r[1])
+        if 0 == len(results):
+            return results
+        best = [rundir for seed, rundir in runs if seed == results[0][0]][0]
+        for fn in (prefix + ".pdb", prefix + "-1.fit"):
+            shutil.move(os.path.join(best.temp_dir, fn),
+                        os.path.join(folder, fn))
+    finally:
+        for seed, rundir in runs:
+            rundir.cleanup()
+
+    values = [chi2 for seed, chi2 in results]
+    mean = sum(values) / len(values)
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+    for seed, chi2 in results:
+        message("SASREF seed %8d Chi-square = %g" % (seed, chi2))
+    message("SASREF %d of %d starts finished, Chi-square best %g, worst %g, "
+            "mean %g, std.dev. %g" % (len(values), starts, values[0],
+                                      values[-1], mean, std))
+    return results
+
+def sasref(SaxsDataFileName, models = [], mode = 'local', viewer='primus',
+           starts = 1, workers = 0, outdir = ''):
+    '''Execute SASREF and apply obtained transformations to subunits
+
+    With starts > 1, as many SASREF runs with different random seeds
+    are executed concurrently and only the best solution is applied.
+    The .pdb and .fit files are written to outdir, default the current
+    directory.
+    '''
+
+    #parameter configuration
+    #local refinment (to reproduce MASSHA behaviour):
+    confp = {'spst':'1.0', # spatial step, SASREF default is 5.0 Angstrom
+             'anst':'5.0', #angular step, SASREF default is 20 degrees
+             'init':'1.0', # Initial annealing temperature (def= 10)
+             'sche':'0.9', # Annealing schedule factor
+             'iter':'500', # Max # of iterations at each T (def = 10000)
+             'maxs':' 50', # Max # of successes at each T (def = 1000)
+             'mins':' 10', # Min # of successes to continue (def = 100)
+             'maxa':' 10', # Max # of annealing steps (def = 100)
+             'msol':'  1', # Max # of solutions to store (def = 1)
+             'shft':' '}   #xyz init shift, blank for local
+                           #0.0 for global search
+
+    if 'global' == mode: #settings for default global search
+        confp['spst'] =  '5.0'
+        confp['anst'] = '20.0'
+        confp['init'] = '10.0'
+        confp['sche'] =  '0.9'
+        confp['iter'] = '10000'
+        confp['maxs'] = '1000'
+        confp['mins'] = '100'
+        confp['maxa'] = '100'
+        confp['msol'] = '1'
+        confp['shft'] = '0.0'
+
+    if False == os.path.isfile(SaxsDataFileName):
+        message("SAXS .dat file \'"+SaxsDataFileName+"\' not found")
+        return 113
+    fileFullPath = os.path.abspath(SaxsDataFileName)
+    models = selectionList(models)
+    starts = int(starts)
+
+    prefix = 'sasref' + repr(session.nextRun())
+
+    with TemporaryDirectory(prefix) as tmpdir:
+        #sasref can not deal with long path/names
+        tmpsaxsfn =  os.path.basename(SaxsDataFileName)
+        tmpdir.copy_in(fileFullPath, tmpsaxsfn);
+
+        #compute amplitudes of all subunits at once
+        alms = computeAmplitudes(models, tmpdir.temp_dir)
+        if None in alms:
+            message("ERROR CRYSOL amplitudes could not be computed for "
+                    + repr([m for m, a in zip(models, alms) if a is None]))
+            return 114
+
+        if 1 < starts:
+            results = sasrefMultiStart(prefix, tmpdir.temp_dir, tmpsaxsfn,
+                                       alms, confp, starts, workers)
+            if 0 == len(results):
+                message("ERROR none of the SASREF runs finished")
+                return 115
+        else:
+            comfn = 'setup_sasref.com'
+            with open(tmpdir.path(comfn), 'w') as commandfile:
+                commandfile.write(sasrefCommandFile(prefix, tmpsaxsfn,
+                                                    alms, confp))
+            runSasref(tmpdir.temp_dir, comfn)
+
+        outpdb = tmpdir.path(prefix + ".pdb")
+        if not os.path.isfile(outpdb):
+            message("ERROR SASREF did not write \'" + prefix + ".pdb\'")
+            return 116
+        #read and apply movements
+        moves = readSasrefPdb(outpdb, len(models))
+        applySubunitMoves(models, moves)
+
+        outpdbfn = tmpdir.move_out_numbered(prefix + ".pdb", prefix, '.pdb',
+                                            outdir)
+        message( ".pdb file written to " + outpdbfn)
+        cf = tmpdir.move_out_numbered(prefix + "-1.fit", prefix, '.fit',
+                                      outdir)
+        message( ".fit file written to " + cf)
+        mainLoop.call(openSingleDatFile, viewer, cf)
+        chi2 = parseSasrefChi2(cf)
+        recordResult('sasref', " ".join(models), fileFullPath,
+                     hashInputs([mode, repr(starts)],
+                                [os.path.join(tmpdir.temp_dir, fn)
+                                 for fn in [tmpsaxsfn] + alms]),
+                     {'mode':mode, 'starts':starts}, chi2, output=outpdbfn)
+    return {'pdb':outpdbfn, 'fit':cf, 'chi2':chi2}
+
+cmd.extend("sasref", sasref)
@@ -0,0 +1,465 @@
+# python lib
+'''
+SASpy - ATSAS PLUGIN FOR PYMOL
+
+Execution backends for the ATSAS programs started by systemCommand. By
+default every program runs locally; programs can instead be submitted
+to a SLURM batch queue (sbatch/squeue/scancel, optionally through ssh
+on a login node), or to a local stand-in queue for testing:
+
+  saspy_executor sasref sreflex, slurm, --partition=short --time=2:00:00
+  saspy_executor sasref, fakequeue
+  saspy_executor sasref, local
+
+Queued programs work in a job folder below a staging area that the
+compute nodes can read (~/.saspy/stage by default, set SASPY_STAGE).
+Input files are stored there once, by content, and linked into every
+job folder; outputs are moved back when the job has finished. All
+queued jobs of one executor are polled together, in the background.
+
+(c) 2015-2019 A.PANJKOVICH AND H.MERTENS FOR ATSAS TEAM AT EMBL-HAMBURG.
+'''
+import os
+import sys
+import time
+import shutil
+import hashlib
+import tempfile
+import itertools
+import threading
+import subprocess
+
+try:
+    from shlex import quote # python 3
+except ImportError:
+    from pipes import quote # python 2
+
+from pymol import cmd
+
+from .core import (platform, pythonVersion, message, currentJob,
+                   JobCancelled, killProcessGroup, linkOrCopy, localExecutor,
+                   toolExecutors, commandTool)
+
+#files SASpy writes into every job folder
+jobFiles = ('saspy_job.sh', '.saspy_stdin', '.saspy_status', '.saspy_out',
+            '.saspy_err')
+
+class StagingArea:
+    """Job folders and a content-addressed store of their input files
+
+    Every distinct input is copied into the store once and hardlinked
+    (or copied) into the job folders. Stored files are read-only, as
+    they are shared between jobs.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    def folder(self, name):
+        path = os.path.join(self.root, name)
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+        return path
+
+    def digest(self, src):
+        #hash each file once per content, identified by inode and mtime
+        st = os.stat(src)
+        ident = (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+        with self.lock:
+            if ident in self.hashes:
+                return self.hashes[ident]
+        h = hashlib.sha1()
+        with open(src, 'rb') as rf:
+            for chunk in iter(lambda: rf.read(1 << 20), b''):
+                h.update(chunk)
+        with self.lock:
+            self.hashes[ident] = h.hexdigest()
+        return self.hashes[ident]
+
+    def stageFile(self, src):
+        """Path of the stored copy of src"""
+        inputs = self.folder('inputs')
+        dst = os.path.join(inputs, self.digest(src)
+                           + os.path.splitext(src)[1])
+        if os.path.exists(dst):
+            os.utime(dst, None) #mark as recently used, for prune()
+            return dst
+        fd, tmp = tempfile.mkstemp(dir=inputs, prefix='.tmp')
+        os.close(fd)
+        shutil.copyfile(src, tmp)
+        if "win32" != platform:
+            os.chmod(tmp, 0o444)
+        if "win32" == platform and os.path.exists(dst):
+            os.remove(tmp)
+        else:
+            os.rename(tmp, dst)
+        return dst
+
+    def jobFolder(self, tool):
+        return tempfile.mkdtemp(prefix=tool + '_', dir=self.folder('jobs'))
+
+    def prune(self, maxAge = 7 * 24 * 3600):
+        """Remove stored inputs not used for maxAge seconds"""
+        inputs = self.folder('inputs')
+        now = time.time()
+        for fn in os.listdir(inputs):
+            path = os.path.join(inputs, fn)
+            try:
+                if now - os.path.getmtime(path) > maxAge:
+                    os.remove(path)
+            except OSError:
+                pass
+
+class SlurmQueue:
+    """sbatch, squeue and scancel, run locally or through prefix (ssh)"""
+
+    name = 'slurm'
+    finalStates = ('COMPLETED', 'FAILED', 'CANCELLED', 'TIMEOUT',
+                   'NODE_FAIL', 'OUT_OF_MEMORY', 'BOOT_FAIL', 'DEADLINE',
+                   'PREEMPTED')
+
+    def __init__(self, options = [], prefix = []):
+        self.options = list(options)
+        self.prefix = list(prefix)
+
+    def call(self, args):
+        proc = subprocess.Popen(self.prefix + args, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        return (proc.returncode, out.decode('utf-8', 'replace'),
+                err.decode('utf-8', 'replace'))
+
+    def submit(self, script, folder, name):
+        status, out, err = self.call(
+            ['sbatch', '--parsable', '-J', 'saspy_' + name, '-D', folder,
+             '-o', os.path.join(folder, '.saspy_out'),
+             '-e', os.path.join(folder, '.saspy_err')]
+            + self.options + [script])
+        if 0 != status or not out.strip():
+            raise OSError("sbatch failed: " + (err or out).strip())
+        #--parsable prints jobid[;cluster]
+        return out.strip().split(';')[0]
+
+    def active(self, jobids):
+        """The subset of jobids that are still queued or running"""
+        status, out, err = self.call(['squeue', '-h', '-o', '%i %T',
+                                      '-j', ','.join(jobids)])
+        if 0 != status:
+            if 'Invalid job id' in err:
+                #all of them have left the queue
+                return set()
+            raise OSError("squeue failed: " + err.strip())
+        active = set()
+        for line in out.splitlines():
+            words = line.split()
+            if 2 == len(words) and words[1] not in self.finalStates:
+                active.add(words[0])
+        return active
+
+    def cancel(self, jobid):
+        self.call(['scancel', jobid])
+
+#job ids of all LocalQueues, unique within the session
+localJobIds = itertools.count(1)
+
+class LocalQueue:
+    """Stand-in for a batch queue: runs job scripts as local processes
+
+    Jobs wait pending seconds in the queue before they start, to mimic
+    a busy cluster in tests.
+    """
+
+    name = 'fakequeue'
+
+    def __init__(self, options = [], pending = 0.0):
+        self.pending = float(pending)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, script, folder, name):
+        jobid = repr(next(localJobIds))
+        with self.lock:
+            self.jobs[jobid] = [time.time() + self.pending, script, folder,
+                                None]
+        return jobid
+
+    def start(self, entry):
+        script, folder = entry[1], entry[2]
+        kwargs = {}
+        if pythonVersion == 3:
+            kwargs['start_new_session'] = True
+        else:
+            kwargs['preexec_fn'] = os.setsid
+        with open(os.path.join(folder, '.saspy_out'), 'w') as out:
+            with open(os.path.join(folder, '.saspy_err'), 'w') as err:
+                entry[3] = subprocess.Popen(['sh', script], cwd=folder,
+                                            stdout=out, stderr=err, **kwargs)
+
+    def active(self, jobids):
+        active = set()
+        now = time.time()
+        with self.lock:
+            for jobid in jobids:
+                entry = self.jobs.get(jobid)
+                if entry is None:
+                    continue
+                if entry[3] is None and now >= entry[0]:
+                    self.start(entry)
+                if entry[3] is None or entry[3].poll() is None:
+                    active.add(jobid)
+                else:
+                    del self.jobs[jobid]
+        return active
+
+    def cancel(self, jobid):
+        with self.lock:
+            entry = self.jobs.pop(jobid, None)
+        if entry is not None and entry[3] is not None:
+            killProcessGroup(entry[3])
+
+class QueuePoller:
+    """Polls all jobs of one queue together, in a background thread"""
+
+    def __init__(self, queue, interval):
+        self.queue = queue
+        self.interval = interval
+        self.watched = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def watch(self, jobid):
+        """Return an Event that is set when jobid has left the queue"""
+        done = threading.Event()
+        with self.lock:
+            self.watched[jobid] = done
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.poll,
+                                               name = 'saspy_queue')
+                self.thread.daemon = True
+                self.thread.start()
+        return done
+
+    def forget(self, jobid):
+        with self.lock:
+            self.watched.pop(jobid, None)
+
+    def poll(self):
+        while True:
+            with self.lock:
+                jobids = list(self.watched)
+                if not jobids:
+                    self.thread = None
+                    return
+            try:
+                active = self.queue.active(jobids)
+            except (OSError, ValueError) as e:
+                #e.g. the controller is busy, ask again later
+                message("WARNING, could not poll the queue: " + str(e))
+                active = set(jobids)
+            with self.lock:
+                for jobid in jobids:
+                    if jobid not in active and jobid in self.watched:
+                        self.watched.pop(jobid).set()
+            time.sleep(self.interval)
+
+class QueueExecutor:
+    """Runs ATSAS programs as batch jobs in a queue
+
+    The working directory of the program is staged into a job folder;
+    absolute paths among the arguments are staged too (files) or mapped
+    to a name in the job folder that is moved back afterwards (folders,
+    and paths that do not exist yet, e.g. the SREFLEX output folder).
+    New and changed files are moved back to the working directory once
+    the job has left the queue. Shell command lines are run as they are.
+    """
+
+    def __init__(self, queue, staging, interval = 5.0):
+        self.queue = queue
+        self.name = queue.name
+        self.staging = staging
+        self.poller = QueuePoller(queue, interval)
+
+    def stage(self, cwd, folder):
+        #link every file of cwd, return their stat to detect changes
+        before = {}
+        for fn in os.listdir(cwd):
+            src = os.path.join(cwd, fn)
+            if os.path.isfile(src):
+                dst = os.path.join(folder, fn)
+                linkOrCopy(self.staging.stageFile(src), dst)
+                st = os.stat(dst)
+                before[fn] = (st.st_ino, st.st_size, st.st_mtime)
+        return before
+
+    def mapArguments(self, command, folder):
+        args = []
+        outdirs = []
+        for i, arg in enumerate(command):
+            if os.path.isabs(arg) and os.path.isfile(arg):
+                name = "in%d_%s" % (i, os.path.basename(arg))
+                linkOrCopy(self.staging.stageFile(arg),
+                           os.path.join(folder, name))
+                arg = name
+            elif os.path.isabs(arg) and os.path.isdir(arg):
+                name = "out%d_%s" % (i, os.path.basename(arg.rstrip(os.sep)))
+                os.mkdir(os.path.join(folder, name))
+                outdirs.append((name, arg))
+                arg = name
+            elif os.path.isabs(arg) and os.path.isdir(os.path.dirname(arg)):
+                #an output the program creates itself, e.g. sreflex -p
+                name = "out%d_%s" % (i, os.path.basename(arg.rstrip(os.sep)))
+                outdirs.append((name, arg))
+                arg = name
+            args.append(arg)
+        return args, outdirs
+
+    def script(self, folder, command, stdin):
+        if not isinstance(command, str):
+            command = ' '.join([quote(arg) for arg in command])
+        if stdin is not None:
+            with open(os.path.join(folder, '.saspy_stdin'), 'wb') as wf:
+                data = stdin.read()
+                wf.write(data if isinstance(data, bytes)
+                         else data.encode('utf-8'))
+            command += ' < .saspy_stdin'
+        scriptfn = os.path.join(folder, 'saspy_job.sh')
+        with open(scriptfn, 'w') as wf:
+            wf.write("#!/bin/sh\n")
+            wf.write("cd " + quote(folder) + "\n")
+            wf.write(command + "\n")
+            wf.write("echo $? > .saspy_status\n")
+        return scriptfn
+
+    def wait(self, jobid):
+        job = currentJob()
+        done = self.poller.watch(jobid)
+        try:
+            while not done.wait(0.2 if job is not None else None):
+                try:
+                    job.checkCancelled()
+                except JobCancelled:
+                    self.queue.cancel(jobid)
+                    raise
+        finally:
+            self.poller.forget(jobid)
+
+    def unstage(self, folder, cwd, before, outdirs):
+        #move new and changed files back, then the output folders
+        for fn in os.listdir(folder):
+            src = os.path.join(folder, fn)
+            if fn in jobFiles or not os.path.isfile(src):
+                continue
+            st = os.stat(src)
+            if before.get(fn) != (st.st_ino, st.st_size, st.st_mtime):
+                shutil.move(src, os.path.join(cwd, fn))
+        for name, dst in outdirs:
+            top = os.path.join(folder, name)
+            if os.path.isfile(top):
+                shutil.move(top, dst)
+                continue
+            for dirpath, dirnames, filenames in os.walk(top):
+                target = os.path.join(dst, os.path.relpath(dirpath, top))
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+                for fn in filenames:
+                    shutil.move(os.path.join(dirpath, fn),
+                                os.path.join(target, fn))
+
+    def run(self, command, cwd = None, stdin = None, shell = False,
+            **kwargs):
+        cwd = cwd or os.getcwd()
+        tool = commandTool(command)
+        folder = self.staging.jobFolder(tool)
+        before = self.stage(cwd, folder)
+        outdirs = []
+        if not isinstance(command, str):
+            command, outdirs = self.mapArguments(command, folder)
+        scriptfn = self.script(folder, command, stdin)
+        jobid = self.queue.submit(scriptfn, folder, tool)
+        message(tool + " submitted as " + self.name + " job " + jobid)
+        try:
+            self.wait(jobid)
+        except JobCancelled:
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+
+        job = currentJob()
+        for fn in ('.saspy_out', '.saspy_err'):
+            path = os.path.join(folder, fn)
+            if os.path.isfile(path):
+                with open(path, 'r') as rf:
+                    for line in rf:
+                        sys.stdout.write(line)
+                        if job is not None:
+                            job.addOutput(line)
+        try:
+            with open(os.path.join(folder, '.saspy_status'), 'r') as rf:
+                status = int(rf.read().strip() or 1)
+        except (IOError, ValueError):
+            #the job was killed before the program finished
+            status = 1
+        self.unstage(folder, cwd, before, outdirs)
+        if 0 == status:
+            shutil.rmtree(folder, ignore_errors=True)
+        else:
+            message(self.name + " job " + jobid + " failed, job folder kept in "
+                    + folder)
+        return status
+
+def stagingRoot():
+    return os.environ.get('SASPY_STAGE',
+                          os.path.join(os.path.expanduser('~'), '.saspy',
+                                       'stage'))
+
+stagingArea = StagingArea(stagingRoot())
+
+def makeExecutor(kind, options = '', remote = ''):
+    '''Return an executor: local, slurm (sbatch options, remote prefix
+    such as "ssh login-node") or fakequeue (seconds pending)'''
+    if 'local' == kind:
+        return localExecutor
+    if 'slurm' == kind:
+        queue = SlurmQueue(options.split(), remote.split())
+    elif 'fakequeue' == kind:
+        queue = LocalQueue(pending=float(options or 0))
+    else:
+        raise ValueError("unknown executor \'" + kind
+                         + "\', use local, slurm or fakequeue")
+    return QueueExecutor(queue, stagingArea,
+                         1.0 if 'fakequeue' == kind else 5.0)
+
+def saspyExecutor(tools = '', kind = '', options = '', remote = ''):
+    '''Choose where ATSAS programs run
+
+    USAGE: saspy_executor [tool1 tool2 ... [, local|slurm|fakequeue
+           [, options [, remote]]]]
+    slurm options are passed to sbatch, remote is a command prefix for
+    sbatch, squeue and scancel (e.g. ssh login-node); fakequeue options
+    are the seconds jobs stay pending. Without a kind the executors of
+    the tools are shown.
+    '''
+    tools = tools.split()
+    if kind:
+        try:
+            executor = makeExecutor(kind, options, remote)
+        except ValueError as e:
+            message("ERROR " + str(e))
+            return
+        if isinstance(executor, QueueExecutor):
+            stagingArea.prune()
+        for tool in tools:
+            if executor is localExecutor:
+                toolExecutors.pop(tool, None)
+            else:
+                toolExecutors[tool] = executor
+    for tool in tools or sorted(toolExecutors):
+        message(tool + ": " + toolExecutors.get(tool, localExecutor).name)
+    if not tools and not toolExecutors:
+        message("All ATSAS programs run locally")
+
+cmd.extend("saspy_executor", saspyExecutor)
@@ -0,0 +1,741 @@
+# python lib
+'''
+SASpy - ATSAS PLUGIN FOR PYMOL
+
+GUI: the SASpy dialog. Imported on demand when the dialog is opened,
+the procedures themselves are in saspy.core.
+
+(c) 2015-2019 A.PANJKOVICH AND H.MERTENS FOR ATSAS TEAM AT EMBL-HAMBURG.
+'''
+import os
+import sys
+
+try:
+    import Tkinter as tkinter # python 2
+    import tkSimpleDialog as simpledialog
+    import tkMessageBox as messagebox
+    import tkFileDialog as filedialog
+except ImportError:
+    import tkinter # python 3
+    import tkinter.simpledialog as simpledialog
+    import tkinter.messagebox as messagebox
+    import tkinter.filedialog as filedialog
+
+# external lib
+import Pmw
+
+# pymol lib
+from pymol import cmd
+
+from . import core
+from .core import (platform, pythonVersion, saspyVersion, message,
+                   mainLoop, jobEngine, getPlural, checkAtsasVersion,
+                   openDatFile, crysolJob, alpraxin, supalm, batchsupalm,
+                   sasref, sreflex, damdisplay)
+
+class SASpy:
+
+    def __init__(self, app):
+
+        self.parent = app.root
+        self.dialog = Pmw.Dialog(self.parent,
+                                 buttons = ('Quit',
+                                 #'Debug',
+                                 'Refresh model list',
+                                 '3. Execute'),
+                                 title = 'SASpy - ATSAS Plugin for PyMOL',
+                                 command = self.execute)
+        Pmw.setbusycursorattributes(self.dialog.component('hull'))
+        mainLoop.attach(self.parent)
+        self.procedure     = 'empty'
+        self.saxsfn        = tkinter.StringVar()
+        self.sasrefmode    = tkinter.StringVar()
+        self.sasrefmode.set('local')
+        self.sasrefStarts  = tkinter.StringVar()
+        self.sasrefStarts.set('1')
+        self.supalmTemplate = tkinter.StringVar()
+        self.crysolmode    = tkinter.StringVar()
+        self.crysolmode.set('predict')
+        self.prefix        = tkinter.StringVar()
+        self.jobPriority   = tkinter.StringVar()
+        self.jobPriority.set('0')
+        self.maxWorkers    = tkinter.StringVar()
+        self.maxWorkers.set(repr(jobEngine.maxWorkers))
+        self.jobTimeout    = tkinter.StringVar()
+        self.jobTimeout.set('0')
+        self.cancelJobId   = tkinter.StringVar()
+
+        self.datViewer = tkinter.StringVar()
+        self.cwd = tkinter.StringVar()
+        self.cwd.set(os.getcwd())
+        self.datViewer.set("primus") #on linux
+        if "win32" == platform:
+            self.datViewer.set("primusqt")
+        if "darwin" == platform:
+            self.datViewer.set("primus")
+            # OLD default below (cannot be used if installation is elsewhere):
+            #self.datViewer.set("/Applications/ATSAS/primus.app")
+
+        self.warnLabel = tkinter.Label( self.dialog.interior(),
+                                    anchor='center',
+                                    fg ="red",
+        text = 'No models found. Please open/load structures in PyMOL to proceed.')
+
+        description  = "SASpy - ATSAS Plugin for PyMOL\n"
+        description += "ATSAS " + saspyVersion + "\n\n"
+        description += "European Molecular Biology Laboratory\n"
+        description += "Hamburg Outstation, ATSAS Team, 2015-2017.\n"
+
+
+        w = tkinter.Label(self.dialog.interior(),
+                          text = description,
+                          background = 'white', foreground = 'blue')
+        w.pack(expand = 1, fill = 'both', padx = 10, pady = 5)
+
+        self.procLabel = tkinter.Label( self.dialog.interior(),
+                                        anchor='w',
+                                        text = '1. Choose procedure:')
+        self.procLabel.pack(fill='both', expand=True, padx=10, pady=5)
+
+        #NOTEBOOK START
+        self.notebook = Pmw.NoteBook(self.dialog.interior(),raisecommand=self.tabSelection)
+        self.notebook.pack(fill = 'both', expand=2, padx=10, pady=10)
+
+        #the tabs are built when they are selected for the first time
+        self.tabBuilders = {'crysol':self.buildCrysolTab,
+                            'alpraxin':self.buildAlpraxinTab,
+                            'supalm':self.buildSupalmTab,
+                            'sasref':self.buildSasrefTab,
+                            'sreflex':self.buildSreflexTab,
+                            'damdisplay':self.buildDamdisplayTab,
+                            'configure':self.buildConfigureTab,
+                            'jobs':self.buildJobsTab}
+        self.builtTabs = set()
+        for name in ('crysol', 'alpraxin', 'supalm', 'sasref', 'sreflex',
+                     'damdisplay', 'configure', 'jobs'):
+            self.notebook.add(name)
+
+        #Model selection
+        self.modsW = self.createModelSelectionWidget()
+        self.modsW.pack(expand=1, fill='both', padx=10, pady=5)
+        self.refreshModelSelectionWidget()
+
+        self.notebook.setnaturalsize()
+
+        self.ATSAS_sanityCheck()
+
+#TABS
+
+    def buildCrysolTab(self):
+        crysolTab = self.createTab("crysol", 
+         "Prediction of theoretical intensities and optionally fit\n"+
+         "to experimental SAXS data. Please select at least one model\n"+
+         "(and a SAXS .dat file for fit mode). In batch mode each\n"+
+         "model is fitted separately and the models are ranked by chi2."
+        )
+        self.crymodebut = Pmw.RadioSelect(crysolTab,
+                                    buttontype='radiobutton',
+                                    labelpos='w',
+                                    label_text="Mode:",
+                                    command=self.setCrysolMode,
+                                    selectmode = 'single')
+        self.crymodebut.grid(sticky='we', row=2, column=0, padx=5, pady=2)
+        self.crymodebut.add('predict')
+        #self.crymodebut.add('simulate')
+        self.crymodebut.add('fit')
+        self.crymodebut.add('batch')
+        self.crymodebut.setvalue('predict')
+
+        saxsfn_ent = Pmw.EntryField(crysolTab,
+                                    label_text = 'SAXS .dat file:',
+                                    labelpos='ws',
+                                    entry_textvariable=self.saxsfn)
+        saxsfn_but = tkinter.Button(crysolTab, text = 'Browse...',
+                                    command = self.getSAXSFile)
+        saxsfn_ent.grid(sticky='we', row=3, column=0, padx=5, pady=2)
+        saxsfn_but.grid(sticky='we', row=3, column=1, padx=5, pady=2)
+
+        #### TRYING to add explicit hydrogen flag ####
+        self.crycalcbut = Pmw.RadioSelect(crysolTab,
+                                    buttontype='radiobutton',
+                                    labelpos='w',
+                                    label_text="Explicit Hydrogens?",
+                                    selectmode = 'single')
+        self.crycalcbut.grid(sticky='we', row=4, column=0, padx=5, pady=2)
+        self.crycalcbut.add('no')
+        self.crycalcbut.add('yes')
+        self.crycalcbut.setvalue('no')
+
+
+        fn = []
+        fn.append('crysol')
+#        self.notebook.setnaturalsize(pageNames=fn)
+
+    def buildAlpraxinTab(self):
+        alpraxinTab = self.createTab("alpraxin", "Position a structure at the origin such that its principal\ninertia vectors are aligned with the coordinate axis.\nPlease select one or more models.")
+        self.enantiobut = Pmw.RadioSelect(alpraxinTab,
+                                    buttontype='radiobutton',
+                                    labelpos='w',
+                                    label_text="Produce enantiomorph as new model:",
+                                    selectmode = 'single')
+        self.enantiobut.grid(sticky='we', row=2, column=0, padx=5, pady=2)
+        self.enantiobut.add('no')
+        self.enantiobut.add('yes')
+        self.enantiobut.setvalue('no')
+
+    def buildSupalmTab(self):
+        supalmTab = self.createTab('supalm', 'Superimposition of models and calculation of\nnormalized spatial discrepancy (NSD).\nPlease select two or more models, the first one is the template,\nunless a template is given below.')
+        template_ent = Pmw.EntryField(supalmTab,
+                                      label_text = 'Template (optional):',
+                                      labelpos='ws',
+                                      entry_textvariable=self.supalmTemplate)
+        template_ent.grid(sticky='we', row=2, column=0, padx=5, pady=5)
+
+    def buildSasrefTab(self):
+        sasreftab = self.createTab("sasref", "Quaternary structure modeling against solution scattering data.\nPlease select multiple models (rigid bodies) and a SAXS .dat file.\nRecommendation: execute alpraxin before refinement.")
+        saxsfn_ent = Pmw.EntryField(sasreftab,
+                                    label_text = 'SAXS .dat file:',
+                                    labelpos='ws',
+                                    entry_textvariable=self.saxsfn)
+        saxsfn_but = tkinter.Button(sasreftab, text = 'Browse...',
+                                    command = self.getSAXSFile)
+        saxsfn_ent.grid(sticky='we', row=3, column=0, padx=5, pady=5)
+        saxsfn_but.grid(sticky='we', row=3, column=1, padx=5, pady=5)
+
+        self.sasrefmodebut = Pmw.RadioSelect(sasreftab,
+                                    buttontype='radiobutton',
+                                    labelpos='w',
+                                    label_text="Refinement mode:",
+                                    command=self.setSasrefMode,
+                                    selectmode = 'single')
+        self.sasrefmodebut.grid(sticky='we', row=2, column=0, padx=5, pady=2)
+        self.sasrefmodebut.add('local')
+        self.sasrefmodebut.add('global')
+        self.sasrefmodebut.setvalue('local')
+
+        sasrefstarts_ent = Pmw.EntryField(sasreftab,
+                                    label_text = 'Random starts (best is kept):',
+                                    labelpos='ws',
+                                    validate = {'validator':'integer',
+                                                'min':1, 'max':1000},
+                                    entry_textvariable=self.sasrefStarts)
+        sasrefstarts_ent.grid(sticky='we', row=4, column=0, padx=5, pady=5)
+
+    def buildSreflexTab(self):
+        sreflexTab = self.createTab("sreflex", "Model refinement based on SAXS data and normal mode analysis.\nPlease select models and a SAXS .dat file.")
+        saxsfn_ent = Pmw.EntryField(sreflexTab,
+                                    label_text = 'SAXS .dat file:',
+                                    labelpos='ws',
+                                    entry_textvariable=self.saxsfn)
+        saxsfn_but = tkinter.Button(sreflexTab, text = 'Browse...',
+                                    command = self.getSAXSFile)
+        saxsfn_ent.grid(sticky='we', row=3, column=0, padx=5, pady=5)
+        saxsfn_but.grid(sticky='we', row=3, column=1, padx=5, pady=5)
+
+    def buildDamdisplayTab(self):
+        self.damColor = tkinter.StringVar();
+        self.damColor.set('white');
+        self.damTrans = tkinter.StringVar();
+        self.damTrans.set('0.5');
+        damdisplayTab = self.createTab("damdisplay", "Apply a predefined representation to a dummy-atom-model (DAM).\nPlease select one model.")
+        damDisplayColorEntry = Pmw.EntryField(damdisplayTab,
+                                    label_text = 'Color:',
+                                    labelpos='ws',
+                                    entry_textvariable=self.damColor)
+        damDisplayColorEntry.grid(sticky='we', row=3, column=1, padx=5, pady=5)
+        damDisplayTransEntry = Pmw.EntryField(damdisplayTab,
+                                    label_text = 'Transparency:',
+                                    labelpos='ws',
+                                    entry_textvariable=self.damTrans)
+        damDisplayTransEntry.grid(sticky='we', row=4, column=1, padx=5, pady=5)
+
+    def buildConfigureTab(self):
+        configTab = self.createTab("configure", "Settings available to configure SASpy:")
+        # saxs viewer selection
+        svi_ent = Pmw.EntryField(configTab,
+                                    label_text = 'SAXS viewer:',
+                                    labelpos='ws',
+                                    entry_textvariable = self.datViewer)
+        svi_but = tkinter.Button(configTab, text = 'Select SAXS viewer',
+                                    command = self.getSAXSViewer)
+        svi_ent.grid(sticky='we', row=3, column=0, padx=5, pady=5)
+        svi_but.grid(sticky='we', row=3, column=1, padx=5, pady=5)
+
+        #working directory selection
+        wd_ent = Pmw.EntryField(configTab,
+                                    label_text = 'Current working dir:',
+                                    labelpos='ws',
+                                    entry_textvariable = self.cwd)
+        #wd_ent.grid(sticky='w', row=2, column=0, columnspan=3, padx=5, pady=2)
+        wd_ent.grid(sticky='w', row=2, column=0, padx=5, pady=2)
+        scd_but = tkinter.Button(configTab, text = 'Select working directory',
+                                    command = self.setWorkingDirectory)
+        scd_but.grid(sticky='we', row=2, column=1, padx=5, pady=2)
+
+        #job scheduling
+        workers_ent = Pmw.EntryField(configTab,
+                                    label_text = 'Concurrent jobs:',
+                                    labelpos='ws',
+                                    validate = {'validator':'integer',
+                                                'min':1, 'max':256},
+                                    entry_textvariable = self.maxWorkers)
+        workers_ent.grid(sticky='we', row=4, column=0, padx=5, pady=5)
+        workers_but = tkinter.Button(configTab, text = 'Set concurrent jobs',
+                                    command = self.setMaxWorkers)
+        workers_but.grid(sticky='we', row=4, column=1, padx=5, pady=5)
+        prio_ent = Pmw.EntryField(configTab,
+                                    label_text = 'Priority of new jobs:',
+                                    labelpos='ws',
+                                    validate = {'validator':'integer'},
+                                    entry_textvariable = self.jobPriority)
+        prio_ent.grid(sticky='we', row=5, column=0, padx=5, pady=5)
+        timeout_ent = Pmw.EntryField(configTab,
+                                    label_text = 'Timeout of new jobs (min, 0 = none):',
+                                    labelpos='ws',
+                                    validate = {'validator':'real', 'min':0},
+                                    entry_textvariable = self.jobTimeout)
+        timeout_ent.grid(sticky='we', row=6, column=0, padx=5, pady=5)
+
+    def buildJobsTab(self):
+        jobsTab = self.createTab("jobs", "Submitted jobs, higher priority jobs are started first.\nThe number of concurrent jobs can be set in the configure tab.")
+        self.jobTable = Pmw.ScrolledText(jobsTab,
+                                    text_font = ('Courier', 10),
+                                    text_height = 10, text_width = 72,
+                                    text_wrap = 'none')
+        self.jobTable.grid(sticky='we', row=2, column=0, columnspan=2,
+                           padx=5, pady=5)
+        cancel_ent = Pmw.EntryField(jobsTab,
+                                    label_text = 'Job id:',
+                                    labelpos='ws',
+                                    validate = {'validator':'integer', 'min':1},
+                                    entry_textvariable = self.cancelJobId)
+        cancel_ent.grid(sticky='we', row=3, column=0, padx=5, pady=5)
+        cancel_but = tkinter.Button(jobsTab, text = 'Cancel job',
+                                    command = self.cancelJob)
+        cancel_but.grid(sticky='we', row=3, column=1, padx=5, pady=5)
+        trace_but = tkinter.Button(jobsTab, text = 'Show chi2 trace',
+                                    command = self.showJobTrace)
+        trace_but.grid(sticky='we', row=4, column=1, padx=5, pady=5)
+        self.refreshJobTable()
+
+#GUI FUNCTIONS
+
+    def errorWindow(self, title, msg):
+        messagebox.showerror(title,
+                               "ERROR\n" + msg, 
+                               parent=self.parent)
+        return
+
+    def notificationWindow(self, title, msg):
+        messagebox.showinfo(title, msg,
+                               parent=self.parent)
+        return
+
+    def ATSAS_sanityCheck(self):
+        msg = checkAtsasVersion()
+        if "NOBIN" == msg:
+            msg = "ATSAS binaries not found, please install ATSAS and/or "
+            msg += "update the binary PATH in your ~/pymolrc.pml file.\n"
+            msg += "SASpy will quit now."
+            message(msg)
+            self.errorWindow("ERROR", msg)
+            self.execute("Quit")
+            return
+        if "OK" != msg:
+            message(msg)
+            self.errorWindow("ERROR", msg)
+        return
+
+    def createModelSelectionWidget(self):
+        modsW = Pmw.RadioSelect(self.dialog.interior(),
+                                    buttontype='button',
+                                    labelpos='w',
+                                    label_text="2. Model selection:",
+                                    selectmode = 'multiple')
+        mols = self.getListOfModels()
+        for m in mols:
+            modsW.add(m)
+        return modsW
+
+    def countSelectedModels(self):
+        counter = 0
+        ma = self.modsW.getcurselection()
+        for m in ma:
+            counter += 1
+        return counter
+
+    def setCrysolMode(self, mode):
+        print("Setting crysol mode to "+mode)
+        self.crysolmode.set(mode)
+        self.crymodebut.setvalue(mode)
+#        self.crycalc.set(mode)
+#        self.crycalcbut.setvalue(mode)
+
+    def setSasrefMode(self, mode):
+        print("Setting sasref mode to "+mode)
+        self.sasrefmode.set(mode)
+        self.sasrefmodebut.setvalue(mode)
+
+    def setDatMode(self, mode):
+        print("Setting open mode to " + mode)
+        global datmode
+        datmode.set(mode)
+        self.datmodebut.setvalue(mode)
+
+    def submitSaspyJob(self, procType, models = []):
+        #all procedures run in the background job engine,
+        #their arguments are read from the widgets here, on the GUI thread
+        models = list(models)
+        viewer = self.datViewer.get()
+        if procType in ('sasref', 'sreflex'):
+            #check if saxs file is available
+            saxsfn = self.saxsfn.get()
+            if False == os.path.isfile(saxsfn):
+                self.errorWindow("FILE NOT FOUND",
+                                 "SAXS file \'"+saxsfn+"\' NOT FOUND.");
+                return
+        priority = self.getJobPriority()
+        timeout = self.getJobTimeout()
+        if "alpraxin" == procType:
+            jobEngine.submit(procType, alpraxin,
+                             (models, self.enantiobut.getvalue()),
+                             priority, timeout)
+        elif "crysol" == procType:
+            self.crysol(models, self.crycalcbut.getvalue())
+        elif "damdisplay" == procType:
+            jobEngine.submit(procType, mainLoop.call,
+                             (damdisplay, models[0], self.damColor.get(),
+                              self.damTrans.get()), priority)
+        elif "supalm" == procType:
+            template = self.supalmTemplate.get().strip() or models[0]
+            toalign = [m for m in models if m != template]
+            if template not in cmd.get_object_list():
+                self.errorWindow("Template not found",
+                                 "There is no model \'" + template + "\'.")
+                return
+            if 0 == len(toalign):
+                self.errorWindow("No model selected",
+                                 "Please select models other than the "
+                                 "template \'" + template + "\'.")
+                return
+            if 1 == len(toalign):
+                jobEngine.submit(procType, supalm, (template, toalign[0]),
+                                 priority, timeout)
+            else:
+                jobEngine.submit(procType, batchsupalm,
+                                 (template, toalign),
+                                 priority, timeout)
+        elif 'sasref' == procType:
+            try:
+                starts = max(1, int(self.sasrefStarts.get()))
+            except ValueError:
+                starts = 1
+            jobEngine.submit(procType, sasref,
+                             (saxsfn, models, self.sasrefmode.get(), viewer,
+                              starts),
+                             priority, timeout)
+        elif 'sreflex' == procType:
+            jobEngine.submit(procType, sreflex, (saxsfn, models, viewer),
+                             priority, timeout)
+        return
+
+    def prepareJobAndSubmit(self):
+        procType = self.procedure
+        seln = self.countSelectedModels()
+
+        if procType in ('configure', 'jobs'):
+            return
+
+        if 0 == seln:
+            self.errorWindow("No model selected", "Please select models")
+            return
+
+        #some procedures need an exact number of models selected
+        expect_dict = { #expected number of models
+                     'damdisplay':1,
+        #other procedures need a minimum number of selected models
+                     'supalm':11,
+                     'alpraxin':11,
+                     'sreflex':11, #subtract ten to obtain min expected
+                     'crysol':11,
+                     'sasref':12,
+                    }
+        expn = expect_dict[procType]
+
+        if 10 > expn: #procedure needs an exact number of selected models
+            if expn != seln:
+                self.errorWindow("Wrong number of models selected",
+                "You selected "+ getPlural(seln) + ", but \'" + procType+ "\' expects "+getPlural(expn)+".\n")
+                return
+        else: #the procedure needs a minimum number of selected models
+            expn = expn - 10
+            if seln < expn:
+                self.errorWindow("Wrong number of models selected",
+                "You selected "+ getPlural(seln) + ", but \'" + procType +
+                "\' expects at least " + getPlural(expn) +".\n")
+                return
+
+        self.submitSaspyJob(procType, self.modsW.getcurselection())
+        return        
+
+    def getListOfModels(self):
+        #models can not contain the underscore character '_'
+        #this is a Pmw limitation, but PyMOL does add such
+        #characters often
+        #dots are also removed, as they confuse crysol
+        initialList = cmd.get_object_list()
+        outputList = list();
+        for m in initialList:
+            if '_' in m:
+
+    # Python 2 and 3 string table handling:
+
+                if pythonVersion == 3:
+                    try:
+                        newName = m.translate(m.maketrans('', '',"_"))
+                        pass
+                    except ValueError:
+                        pass
+                else:
+                    try:
+                        newName = m.translate(None,"_")
+                        pass
+                    except ValueError:
+                        pass
+                cmd.set_name(m,newName)
+                message("WARNING Renaming model \'"+m+ "\' to \'"+ newName+"\'")
+                m = newName
+
+            if '.' in m:
+
+    # Python 2 and 3 string table handling:
+
+                if pythonVersion == 3:
+                    try:
+                        newName = m.translate(m.maketrans('', '',"."))
+                        pass
+                    except ValueError:
+                        pass
+                else:
+                    try:
+                        newName = m.translate(None,"_")
+                    except:
+                        pass
+                cmd.set_name(m,newName)
+                message("WARNING Renaming model \'"+m+ "\' to \'"+ newName+"\'")
+                m = newName
+            outputList.append(m)
+        return outputList
+
+    def refreshModelSelectionWidget(self):
+        self.modsW.deleteall()
+        mols = self.getListOfModels()
+        for m in mols:
+            if '_' in m:
+                newName = m
+                newName.replace('_', '-')
+                cmd.set_name(m,newName)
+                m = newName
+                message("Renaming a model...")
+            self.modsW.add(m)
+        if 1 > len(self.getListOfModels()):
+            self.warnLabel.pack(fill='both', expand=True, padx=10, pady=5)
+        else:
+            self.warnLabel.pack_forget()
+        return
+
+    def createTab(self, name = 'empty', description = 'empty'):
+        page = self.notebook.page(name)
+        tab_struc = tkinter.LabelFrame(page, text = name)
+        tab_struc.pack(fill='both', expand=True, padx=10, pady=10)
+        desc = tkinter.Label(tab_struc, justify="left", text = description, pady=2)
+        desc.grid(sticky='w', row=0, column=0, columnspan=4, padx=10, pady=10)
+        return tab_struc
+
+    def openCurrentDatFile(self):
+        currentDat = core.session.latestCurves()
+#        message("About to open current dat file: " + repr(currentDat))
+        if 0 == len(currentDat):
+            messagebox.showerror('No curve yet',
+                                   'No SAXS intensities have been calculated yet',
+                                    parent=self.parent)
+
+        else:
+            openDatFile(self.datViewer.get(), currentDat)
+        return
+
+    def setMaxWorkers(self):
+        try:
+            jobEngine.setWorkers(int(self.maxWorkers.get()))
+        except ValueError:
+            self.errorWindow("Wrong number of jobs",
+                             "Please give a positive number of concurrent jobs.")
+        return
+
+    def getJobPriority(self):
+        try:
+            return int(self.jobPriority.get())
+        except ValueError:
+            return 0
+
+    def getJobTimeout(self):
+        #seconds, the GUI asks for minutes
+        try:
+            return 60.0 * float(self.jobTimeout.get())
+        except ValueError:
+            return 0
+
+    def selectedJob(self):
+        try:
+            return jobEngine.get(int(self.cancelJobId.get()))
+        except ValueError:
+            return None
+
+    def showJobTrace(self):
+        job = self.selectedJob()
+        if job is None:
+            self.errorWindow("No job selected", "Please give a job id.")
+            return
+        top = tkinter.Toplevel(self.parent)
+        top.title("SASpy job " + repr(job.id) + " - chi2 trace")
+        canvas = tkinter.Canvas(top, width = 480, height = 300,
+                                background = 'white')
+        canvas.pack(fill = 'both', expand = True)
+        self.drawJobTrace(job, canvas)
+
+    def drawJobTrace(self, job, canvas):
+        #redraw while the job runs and the window is open
+        if not canvas.winfo_exists():
+            return
+        with job.lock:
+            trace = list(job.trace)
+        canvas.delete('all')
+        w = int(canvas.winfo_width()) or 480
+        h = int(canvas.winfo_height()) or 300
+        margin = 40
+        canvas.create_text(w / 2, 12, text = job.name + " " + job.state
+                           + "  " + job.progressText())
+        canvas.create_line(margin, h - margin, w - 10, h - margin)
+        canvas.create_line(margin, 25, margin, h - margin)
+        if 1 < len(trace):
+            lo = min(c for s, c in trace)
+            hi = max(c for s, c in trace)
+            if hi == lo:
+                hi = lo + 1.0
+            n = trace[-1][0]
+            points = []
+            for step, chi2 in trace:
+                points.append(margin + (w - margin - 10) * step / float(n))
+                points.append(h - margin - (h - margin - 25) * (chi2 - lo) / (hi - lo))
+            canvas.create_line(*points, fill = 'blue')
+            canvas.create_text(margin - 2, 25, anchor = 'e',
+                               text = "%.3g" % hi)
+            canvas.create_text(margin - 2, h - margin, anchor = 'e',
+                               text = "%.3g" % lo)
+            canvas.create_text(w - 10, h - margin + 12, anchor = 'e',
+                               text = "step " + repr(n))
+        if job.state in ('queued', 'running'):
+            self.parent.after(1000, self.drawJobTrace, job, canvas)
+
+    def cancelJob(self):
+        try:
+            jobid = int(self.cancelJobId.get())
+        except ValueError:
+            self.errorWindow("No job selected", "Please give a job id.")
+            return
+        if not jobEngine.cancel(jobid):
+            self.errorWindow("Job not active",
+                             "Job " + repr(jobid) + " is not queued or running.")
+            return
+        self.jobTable.settext(jobEngine.table())
+        return
+
+    def refreshJobTable(self):
+        if not self.jobTable.winfo_exists():
+            return
+        self.jobTable.settext(jobEngine.table())
+        self.parent.after(1000, self.refreshJobTable)
+
+    def getSAXSViewer(self):
+        file_name = filedialog.askopenfilename(
+            title='SAXS viewer', initialdir='',
+            parent=self.parent)
+        self.datViewer.set(file_name)
+        return
+
+    def setWorkingDirectory(self):
+        newWorkDir = filedialog.askdirectory(
+            title='Set working directory', initialdir='',
+            parent=self.parent)
+        cmd.cd(newWorkDir)
+        self.cwd.set(newWorkDir)
+        message("Working directory changed to: " + newWorkDir);
+        return
+
+    def getSAXSFile(self):
+        if 'crysol' == self.procedure and 'batch' != self.crysolmode.get():
+            self.setCrysolMode('fit')
+        opts = {}
+        opts['filetypes'] = [('SAXS .dat files','.dat'),('all files','.*')]
+        file_name = filedialog.askopenfilename(**opts)
+        self.saxsfn.set(file_name)
+        return
+
+    def tabSelection(self, pagename):
+        if pagename not in self.builtTabs:
+            self.builtTabs.add(pagename)
+            self.tabBuilders[pagename]()
+        #refresh each time a tab is selected
+        self.cwd.set(os.getcwd()) #I don't know how to refresh this if the 
+                             #user just calls 'cd'
+        self.procedure = pagename
+        return
+
+    def crysol(self, selection, param=""):
+        #wrapper for the different crysol modes
+        crymode = self.crysolmode.get()
+        if 1 < len(selection) and 'batch' != crymode:
+            message("CRYSOL will be executed for a complex")
+            message("made of the following models: "+repr(selection))
+        crycalc = self.crycalcbut.getvalue()
+        saxsfn = self.saxsfn.get()
+        if crymode in ('fit', 'batch'):
+            if False == os.path.isfile(saxsfn):
+                self.errorWindow("FILE NOT FOUND",
+                             "SAXS file \'"+saxsfn+"\' NOT FOUND.");
+                return
+        jobEngine.submit('crysol', crysolJob,
+                         (crymode, crycalc, selection, saxsfn,
+                          self.datViewer.get()),
+                         self.getJobPriority(), self.getJobTimeout())
+        return
+            
+    def execute(self, cmd):
+        """ Run the cmd represented by the button clicked by user.
+        """
+        if cmd == 'OK':
+            print('is everything OK?')
+
+        elif cmd == 'Refresh model list':
+            self.refreshModelSelectionWidget()
+
+#        elif cmd == 'Debug':
+
+        elif cmd == '3. Execute':
+            self.prepareJobAndSubmit()
+
+        elif cmd == 'Quit':
+            for j in jobEngine.activeJobs():
+                print("WARNING, a job is still " + j.state + ": "
+                      + repr(j.id) + " " + j.name)
+
+            message('Quit')
+            if __name__ == '__main__':
+                self.parent.destroy()
+            else:
+                self.dialog.withdraw()
+
+        else:
+            print('Terminating SASpy Plugin...')
+            self.dialog.withdraw()
+            print('Done.')
@@ -0,0 +1,162 @@
+# python lib
+'''
+SASpy - ATSAS PLUGIN FOR PYMOL
+
+Results store: a local SQLite database with every job run by SASpy and
+the metrics (chi2, Rg, eDens, NSD) and output files of its results.
+
+(c) 2015-2019 A.PANJKOVICH AND H.MERTENS FOR ATSAS TEAM AT EMBL-HAMBURG.
+'''
+import os
+import json
+import time
+import threading
+
+try:
+    import sqlite3
+except ImportError:
+    print('Warning: sqlite3 not found, SASpy results will not be stored.')
+    sqlite3 = None
+
+schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    session TEXT, job INTEGER, procedure TEXT, parameters TEXT,
+    state TEXT, error TEXT, submitted REAL, started REAL, finished REAL,
+    seconds REAL);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    session TEXT, job INTEGER, procedure TEXT, model TEXT, dataset TEXT,
+    input_hash TEXT, parameters TEXT, chi2 REAL, rg REAL, edens REAL,
+    nsd REAL, output TEXT, created REAL);
+CREATE INDEX IF NOT EXISTS results_session ON results (session, procedure);
+CREATE INDEX IF NOT EXISTS runs_session ON runs (session, job);
+'''
+
+runColumns = ('session', 'job', 'procedure', 'parameters', 'state', 'error',
+              'submitted', 'started', 'finished', 'seconds')
+resultColumns = ('session', 'job', 'procedure', 'model', 'dataset',
+                 'input_hash', 'parameters', 'chi2', 'rg', 'edens', 'nsd',
+                 'output', 'created')
+metricColumns = ('chi2', 'rg', 'edens', 'nsd')
+
+def toJson(value):
+    #procedure arguments may hold anything, unknown types are stored as repr
+    return json.dumps(value, default=repr, sort_keys=True)
+
+class ResultsStore:
+    """SQLite database of runs and results, shared by all sessions
+
+    Rows are buffered in memory and written with one transaction per
+    flush, which happens when flushSize rows are waiting, when flush()
+    is called (e.g. when the job engine becomes idle) and before every
+    query. Metrics of 9999, the parsers' value for 'not found', are
+    stored as NULL.
+    """
+
+    def __init__(self, path, session, flushSize = 1000):
+        self.path = path
+        self.session = session
+        self.flushSize = flushSize
+        self.lock = threading.Lock()
+        self.runs = []
+        self.results = []
+        self.ready = False
+
+    def enabled(self):
+        return sqlite3 is not None and bool(self.path)
+
+    def connect(self):
+        #called with the lock held
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        con = sqlite3.connect(self.path, timeout = 30)
+        if not self.ready:
+            con.executescript(schema)
+            self.ready = True
+        return con
+
+    def add(self, run = None, results = ()):
+        """Buffer a run (dict of runColumns) and its result dicts"""
+        if not self.enabled():
+            return
+        with self.lock:
+            if run is not None:
+                run = dict(run, session = self.session)
+                self.runs.append(tuple(run.get(c) for c in runColumns))
+            for r in results:
+                r = dict(r, session = self.session)
+                r.setdefault('created', time.time())
+                for c in metricColumns:
+                    if r.get(c) is not None and 9999 == float(r[c]):
+                        r[c] = None
+                self.results.append(tuple(r.get(c) for c in resultColumns))
+            full = len(self.runs) + len(self.results) >= self.flushSize
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows in a single transaction"""
+        if not self.enabled():
+            return
+        with self.lock:
+            if not self.runs and not self.results:
+                return
+            runs, self.runs = self.runs, []
+            results, self.results = self.results, []
+            con = self.connect()
+            try:
+                with con:
+                    con.executemany(
+                        "INSERT INTO runs (%s) VALUES (%s)"
+                        % (", ".join(runColumns),
+                           ", ".join("?" * len(runColumns))), runs)
+                    con.executemany(
+                        "INSERT INTO results (%s) VALUES (%s)"
+                        % (", ".join(resultColumns),
+                           ", ".join("?" * len(resultColumns))), results)
+            finally:
+                con.close()
+
+    def query(self, sql, params = ()):
+        """Flush, then return the rows of sql as dicts"""
+        if not self.enabled():
+            return []
+        self.flush()
+        with self.lock:
+            con = self.connect()
+            try:
+                con.row_factory = sqlite3.Row
+                return [dict(row) for row in con.execute(sql, params)]
+            finally:
+                con.close()
+
+    def best(self, procedure = '', metric = 'chi2', limit = 10,
+             session = None):
+        """Results with the lowest metric, of this session by default"""
+        if metric not in metricColumns:
+            raise ValueError("unknown metric \'" + metric + "\', use one of "
+                             + ", ".join(metricColumns))
+        sql = "SELECT * FROM results WHERE %s IS NOT NULL" % metric
+        params = []
+        if session != 'all':
+            sql += " AND session = ?"
+            params.append(session or self.session)
+        if procedure:
+            sql += " AND procedure = ?"
+            params.append(procedure)
+        sql += " ORDER BY %s ASC LIMIT ?" % metric
+        params.append(int(limit))
+        return self.query(sql, params)
+
+    def listRuns(self, limit = 20, session = None):
+        """Most recent runs, of this session by default"""
+        sql = "SELECT * FROM runs"
+        params = []
+        if session != 'all':
+            sql += " WHERE session = ?"
+            params.append(session or self.session)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(int(limit))
+        return self.query(sql, params)
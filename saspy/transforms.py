@@ -0,0 +1,186 @@
+# python lib
+'''
+SASpy - ATSAS PLUGIN FOR PYMOL
+
+Rigid body transforms with NumPy: batches of SASREF moves (centers and
+Euler angles), ALPRAXIN and SUPALM matrices as PyMOL TTT matrices,
+their composition and inverse, pairwise RMSD between sets of poses, and
+the batched update of PyMOL coordinates.
+
+A TTT matrix (see http://www.pymolwiki.org/index.php/Transform_selection)
+is stored as a 4x4 array: rotation R in [:3, :3], translation after
+rotation in [:3, 3] and translation before rotation in [3, :3], so that
+x' = R (x + pre) + post. Stacks of matrices have shape (..., 4, 4).
+
+(c) 2015-2019 A.PANJKOVICH AND H.MERTENS FOR ATSAS TEAM AT EMBL-HAMBURG.
+'''
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pymol import cmd
+
+def requireNumpy():
+    if numpy is None:
+        raise ImportError("NumPy is required for SASpy transforms")
+
+def movesToTTT(moves):
+    """TTT matrices of SASREF moves
+
+    moves -- array (..., 9): old center, Euler angles alpha, beta, gamma
+             in degrees and new center, e.g. a list of SasrefSubunit or a
+             list of solutions, each a list of SasrefSubunit
+    Returns an array (..., 4, 4), the same as anglesToTTTMat per move.
+    """
+    requireNumpy()
+    moves = numpy.asarray(moves, dtype=float)
+    angles = numpy.radians(moves[..., 3:6])
+    sa, sb, sg = [-numpy.sin(angles[..., i]) for i in range(3)]
+    ca, cb, cg = [numpy.cos(angles[..., i]) for i in range(3)]
+    ttt = numpy.zeros(moves.shape[:-1] + (4, 4))
+    ttt[..., 0, 0] = ca * cb * cg - sa * sg
+    ttt[..., 0, 1] = -ca * cb * sg - sa * cg
+    ttt[..., 0, 2] = ca * sb
+    ttt[..., 1, 0] = sa * cb * cg + ca * sg
+    ttt[..., 1, 1] = -sa * cb * sg + ca * cg
+    ttt[..., 1, 2] = sa * sb
+    ttt[..., 2, 0] = -sb * cg
+    ttt[..., 2, 1] = sb * sg
+    ttt[..., 2, 2] = cb
+    ttt[..., :3, 3] = moves[..., 6:9]
+    ttt[..., 3, :3] = -moves[..., 0:3]
+    ttt[..., 3, 3] = 1.0
+    return ttt
+
+def asTTT(matrices):
+    """TTT matrices from flat lists of 16 values (ALPRAXIN, SUPALM)"""
+    requireNumpy()
+    matrices = numpy.asarray(matrices, dtype=float)
+    return matrices.reshape(matrices.shape[:-1] + (4, 4))
+
+def toList(ttt):
+    """Flat list of 16 values of one TTT matrix, for transform_selection"""
+    return [float(v) for v in numpy.asarray(ttt).reshape(16)]
+
+def toAffine(ttt):
+    """Homogeneous 4x4 matrices [R, R pre + post; 0, 1] of TTT matrices"""
+    requireNumpy()
+    ttt = numpy.asarray(ttt, dtype=float)
+    rot = ttt[..., :3, :3]
+    affine = numpy.zeros(ttt.shape)
+    affine[..., :3, :3] = rot
+    affine[..., :3, 3] = numpy.einsum('...ij,...j->...i', rot,
+                                      ttt[..., 3, :3]) + ttt[..., :3, 3]
+    affine[..., 3, 3] = 1.0
+    return affine
+
+def fromAffine(affine):
+    """TTT matrices (without pre-translation) of homogeneous matrices"""
+    requireNumpy()
+    ttt = numpy.array(affine, dtype=float)
+    ttt[..., 3, :3] = 0.0
+    ttt[..., 3, 3] = 1.0
+    return ttt
+
+def compose(first, second):
+    """TTT matrices applying first, then second (broadcast over stacks)"""
+    return fromAffine(numpy.matmul(toAffine(second), toAffine(first)))
+
+def invert(ttt):
+    """TTT matrices undoing ttt"""
+    return fromAffine(numpy.linalg.inv(toAffine(ttt)))
+
+def apply(ttt, coords):
+    """Coordinates (n, 3) moved by one TTT matrix"""
+    requireNumpy()
+    ttt = numpy.asarray(ttt, dtype=float)
+    coords = numpy.asarray(coords, dtype=float)
+    return numpy.dot(coords + ttt[3, :3], ttt[:3, :3].T) + ttt[:3, 3]
+
+def poseCoords(ttts, coords):
+    """Coordinates of every pose of a set of subunits
+
+    ttts -- array (poses, subunits, 4, 4), e.g. movesToTTT of several
+            SASREF solutions
+    coords -- one (n_i, 3) coordinate array per subunit
+    Returns an array (poses, sum of n_i, 3).
+    """
+    requireNumpy()
+    ttts = numpy.asarray(ttts, dtype=float)
+    parts = []
+    for i, xyz in enumerate(coords):
+        xyz = numpy.asarray(xyz, dtype=float)
+        moved = numpy.einsum('pij,pnj->pni', ttts[:, i, :3, :3],
+                             xyz[numpy.newaxis] + ttts[:, i, numpy.newaxis,
+                                                       3, :3])
+        parts.append(moved + ttts[:, i, numpy.newaxis, :3, 3])
+    return numpy.concatenate(parts, axis=1)
+
+def pairwiseRmsd(poses, others = None):
+    """RMSD between all pairs of poses, without superposition
+
+    poses -- array (p, n, 3); others -- array (q, n, 3), default poses
+    Returns a (p, q) array.
+    """
+    requireNumpy()
+    a = numpy.asarray(poses, dtype=float)
+    b = a if others is None else numpy.asarray(others, dtype=float)
+    #|a - b|^2 = |a|^2 + |b|^2 - 2 a.b, all pairs at once
+    aa = numpy.einsum('pni,pni->p', a, a)
+    bb = numpy.einsum('qni,qni->q', b, b)
+    ab = numpy.tensordot(a, b, axes=([1, 2], [1, 2]))
+    sq = (aa[:, numpy.newaxis] + bb[numpy.newaxis, :] - 2.0 * ab) / a.shape[1]
+    return numpy.sqrt(numpy.maximum(sq, 0.0))
+
+def loadTransformed(selections, ttts, state = 1):
+    """Move every selection by its TTT matrix, in one batched update
+
+    The coordinates of all selections are transformed together and
+    written back with cmd.load_coords. Must run in the main thread.
+    """
+    requireNumpy()
+    ttts = numpy.asarray(ttts, dtype=float)
+    coords = [cmd.get_coords(sel, state) for sel in selections]
+    counts = [0 if c is None else len(c) for c in coords]
+    if 0 == sum(counts):
+        return
+    xyz = numpy.concatenate([numpy.asarray(c, dtype=float).reshape(-1, 3)
+                             for c in coords if c is not None])
+    owner = numpy.repeat(numpy.arange(len(selections)), counts)
+    moved = numpy.einsum('nij,nj->ni', ttts[owner, :3, :3],
+                         xyz + ttts[owner, 3, :3]) + ttts[owner, :3, 3]
+    start = 0
+    for sel, n in zip(selections, counts):
+        if 0 < n:
+            cmd.load_coords(moved[start:start + n], sel, state=state)
+        start += n
+
+def superpose(mobile, target):
+    """Least-squares superposition (Kabsch) of a stack of coordinate sets
+
+    mobile -- array (m, n, 3), atoms in the same order as target (n, 3)
+    Returns (ttts, rmsd): the TTT matrices (m, 4, 4) moving each mobile
+    set onto target, and the RMSD (m,) after superposition.
+    """
+    requireNumpy()
+    mobile = numpy.asarray(mobile, dtype=float)
+    target = numpy.asarray(target, dtype=float)
+    mc = mobile.mean(axis=1)
+    tc = target.mean(axis=0)
+    a = mobile - mc[:, numpy.newaxis]
+    b = target - tc
+    u, s, vt = numpy.linalg.svd(numpy.einsum('mni,nj->mij', a, b))
+    #no reflections: flip the smallest singular vector if needed
+    d = numpy.sign(numpy.linalg.det(u) * numpy.linalg.det(vt))
+    d[0 == d] = 1.0
+    vt[:, 2, :] *= d[:, numpy.newaxis]
+    s[:, 2] *= d
+    ttts = numpy.zeros((len(mobile), 4, 4))
+    ttts[:, :3, :3] = numpy.matmul(numpy.swapaxes(vt, 1, 2),
+                                   numpy.swapaxes(u, 1, 2))
+    ttts[:, :3, 3] = tc
+    ttts[:, 3, :3] = -mc
+    ttts[:, 3, 3] = 1.0
+    sq = ((a * a).sum(axis=(1, 2)) + (b * b).sum() - 2.0 * s.sum(axis=1))
+    return ttts, numpy.sqrt(numpy.maximum(sq, 0.0) / target.shape[0])